@@ -0,0 +1,13 @@
+from asgiref.wsgi import WsgiToAsgi
+
+from myblog import create_app
+
+# Entry point of the webapp for an ASGI server (like uvicorn), usually with the async serving mode :
+#     ASYNC_READS=1 uvicorn asgi:asgi_app --workers 4
+# Flask is a WSGI app, so it is wrapped by the ASGI adapter of asgiref, which runs the requests in threads.
+# With ASYNC_READS, the read routes of the posts run their queries on the async engine (see myblog/aio.py), but
+# each request still holds a thread until its response is ready : this does not serve more requests at the same
+# time than gunicorn with the same number of threads (see gunicorn.conf.py).
+
+app = create_app()
+asgi_app = WsgiToAsgi(app)
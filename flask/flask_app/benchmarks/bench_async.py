@@ -0,0 +1,54 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import tempfile
+
+from bench_routes import run  # also adds the webapp folder to the import path
+from myblog.config import Config
+
+# Comparison of the sync and async serving modes (ASYNC_READS) on the read routes, at high concurrency
+# The same scenarios of bench_routes.py run with each mode on the same DB, and the results are shown side by side.
+
+READ_SCENARIOS = ['posts', 'posts_deep_page', 'posts_user', 'search']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the sync and async modes of the blog webapp')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000], help='number of posts in the DB')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128])
+    parser.add_argument('--requests', type=int, default=1000, help='requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', nargs='+', default=READ_SCENARIOS, choices=READ_SCENARIOS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-dir', default=os.path.join(tempfile.gettempdir(), 'myblog-bench'))
+    parser.add_argument('--output', help='write the results of both modes to this JSON file')
+    args = parser.parse_args()
+    args.bcrypt_rounds = Config.BCRYPT_LOG_ROUNDS
+    args.page_cache = False
+    args.url = None  # both modes run in this process, through the WSGI app
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = {}
+    for mode in ('sync', 'async'):
+        print(f'--- {mode} mode', file=sys.stderr)
+        mode_args = copy.copy(args)
+        mode_args.async_reads = mode == 'async'
+        results[mode] = run(mode_args)
+
+    print(f"\n{'':>9}       {'scenario':<16} {'':<5} {'sync req/s':>10} {'async req/s':>11} "
+          f"{'sync p95':>10} {'async p95':>10}")
+    for size, scenarios in results['sync'].items():
+        for name, levels in scenarios.items():
+            for concurrency, sync in levels.items():
+                other = results['async'][size][name][concurrency]
+                print(f"{size:>9} posts {name:<16} c={concurrency:<3} {sync['throughput_rps']:>10} "
+                      f"{other['throughput_rps']:>11} {sync['p95_ms']:>8}ms {other['p95_ms']:>8}ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
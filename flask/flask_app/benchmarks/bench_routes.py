@@ -0,0 +1,255 @@
+import argparse
+import json
+import os
+import queue
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# the benchmarks are in a sub-folder of the webapp, so we add the webapp folder to the import path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bcrypt
+
+from myblog import create_app, db, instrumentation
+from myblog.bulk_load import load_synthetic_data
+from myblog.config import Config
+from myblog.instrumentation import percentile
+from myblog.models import User
+
+# Latency benchmark of the webapp routes (see README.md in this folder)
+#
+# For each DB size, a seeded DB is generated (and kept in --db-dir for the next runs), then every scenario is run
+# at each concurrency level : N threads send requests through the WSGI app (with the Flask test client, so there
+# is no network and no server involved), and we record the throughput, the latency percentiles and the number
+# of SQL queries per request (from the instrumentation).
+#
+# With --url, the requests are sent over HTTP to a running server instead (to compare servers and their settings),
+# the number of SQL queries is then unknown.
+#
+# The results can be saved as a baseline, and later runs compared to it to detect regressions.
+
+
+PASSWORD = 'password'
+
+
+# Config of the benchmarked app : offline (no mail sent), no CSRF tokens in the forms
+def bench_config(db_path, args):
+    class BenchConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        MAIL_SUPPRESS_SEND = True
+        MAIL_QUEUE_ENABLED = False
+        INSTRUMENTATION_ENABLED = True
+        INSTRUMENTATION_MAX_SAMPLES = 100_000
+        INSTRUMENTATION_STATS_ENDPOINT = False
+        INSTRUMENTATION_DUMP_PATH = None
+        BCRYPT_LOG_ROUNDS = args.bcrypt_rounds
+        PAGE_CACHE_BACKEND = 'memory' if args.page_cache else None
+        ASYNC_READS = args.async_reads
+    return BenchConfig
+
+
+# Scenarios : name -> (method, URL, form data, login required)
+# The URLs and data can be functions of the context (DB size, reset token...)
+SCENARIOS = {
+    'home': ('GET', '/', None, False),
+    'posts': ('GET', '/posts', None, False),
+    'posts_deep_page': ('GET', lambda ctx: f"/posts?page={ctx['last_page']}", None, False),
+    'posts_user': ('GET', '/posts?user=1', None, False),
+    'search': ('GET', '/posts/search?q=python+database', None, False),
+    'login_page': ('GET', '/login', None, False),
+    'login': ('POST', '/login', lambda ctx: {'email': ctx['email'], 'password': PASSWORD}, False),
+    'create_page': ('GET', '/posts/create', None, True),
+    'create_post': ('POST', '/posts/create', {'title': 'Benchmark', 'content': 'Benchmark post content'}, True),
+    'account': ('GET', '/account', None, True),
+    'reset_request': ('POST', '/reset_password', lambda ctx: {'email': ctx['email']}, False),
+    'reset_page': ('GET', lambda ctx: f"/reset_password/{ctx['token']}", None, False),
+}
+
+# Scenarios sending each request with a new client, which is not logged in yet (a logged client posting the login
+# form is only redirected, without checking the password)
+FRESH_CLIENT_SCENARIOS = {'login'}
+
+# Status of a successful request, for the scenarios where a failure is not an error status (a failed login answers
+# 200 with the form)
+EXPECTED_STATUS = {'login': 302}
+
+
+def build_db(db_dir, posts, seed):
+    path = os.path.join(db_dir, f'bench_{posts}_{seed}.db')
+    if os.path.exists(path):
+        return path
+    print(f'Building the DB with {posts} posts in {path}', file=sys.stderr)
+
+    class BuildConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    app = create_app(BuildConfig)
+    with app.app_context():
+        db.create_all()
+        password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(4)).decode('utf-8')
+        load_synthetic_data(db.engine, max(10, posts // 100), posts, password_hash, seed)
+        db.engine.dispose()
+    return path
+
+
+# Client sending the requests to a running server over HTTP, with the same methods as the Flask test client
+class HttpClient:
+
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def open(self, url, method='GET', data=None):
+        return self.session.request(method, self.base_url + url, data=data, allow_redirects=False)
+
+    def post(self, url, data=None):
+        return self.open(url, method='POST', data=data)
+
+
+def new_client(app, ctx, login, base_url=None):
+    client = HttpClient(base_url) if base_url else app.test_client()
+    if login:
+        client.post('/login', data={'email': ctx['email'], 'password': PASSWORD})
+    return client
+
+
+def run_scenario(app, ctx, name, concurrency, count, base_url=None):
+    method, url, data, login = SCENARIOS[name]
+    url = url(ctx) if callable(url) else url
+    data = data(ctx) if callable(data) else data
+
+    fresh_client = name in FRESH_CLIENT_SCENARIOS
+    expected_status = EXPECTED_STATUS.get(name)
+
+    # one client per concurrent request, so each has its own session cookie (the logins are not measured)
+    clients = queue.Queue()
+    for _ in range(0 if fresh_client else concurrency):
+        clients.put(new_client(app, ctx, login, base_url))
+    latencies = []
+    errors = []
+
+    def send(_):
+        client = new_client(app, ctx, login, base_url) if fresh_client else clients.get()
+        try:
+            start = time.perf_counter()
+            response = client.open(url, method=method, data=data)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400 or expected_status not in (None, response.status_code):
+                errors.append(response.status_code)
+        finally:
+            if not fresh_client:
+                clients.put(client)
+
+    instrumentation.reset()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(send, range(count)))
+        elapsed = time.perf_counter() - start
+
+    # the SQL queries are only known when the requests run in this process
+    endpoints = {} if base_url else instrumentation.snapshot()['endpoints']
+    sql_counts = [stats['sql_per_request'] for stats in endpoints.values() if stats['sql_per_request'] is not None]
+    latencies.sort()
+    return {
+        'requests': count,
+        'errors': len(errors),
+        'throughput_rps': round(count / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'queries_per_request': max(sql_counts) if sql_counts else 0,
+    }
+
+
+def run(args):
+    results = {}
+    for size in args.sizes:
+        if args.url:
+            # the server must be started on the generated DB, the app is only used to read the test data
+            db_path = build_db(args.db_dir, size, args.seed)
+            print(f'Sending the requests to {args.url}, serving the DB {db_path}', file=sys.stderr)
+        else:
+            # the scenarios write in the DB (new posts...), so they run on a copy of the generated DB
+            db_path = os.path.join(args.db_dir, 'bench_run.db')
+            shutil.copyfile(build_db(args.db_dir, size, args.seed), db_path)
+        app = create_app(bench_config(db_path, args))
+        with app.app_context():
+            user = User.query.get(1)
+            ctx = {
+                'email': user.email,
+                'token': user.generate_reset_token(),
+                'last_page': max(1, size // app.config['POSTS_PER_PAGE']),
+            }
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                result = run_scenario(app, ctx, name, concurrency, args.requests, args.url)
+                results.setdefault(str(size), {}).setdefault(name, {})[str(concurrency)] = result
+                print(f"{size:>9} posts  {name:<16} c={concurrency:<3} {result['throughput_rps']:>8} req/s  "
+                      f"p50={result['p50_ms']:>8}ms  p95={result['p95_ms']:>8}ms  p99={result['p99_ms']:>8}ms  "
+                      f"queries={result['queries_per_request']}  errors={result['errors']}")
+        with app.app_context():
+            db.engine.dispose()
+    return results
+
+
+# List of the regressions of the results compared to the baseline
+def compare(results, baseline, tolerance):
+    regressions = []
+    for size, scenarios in results.items():
+        for name, levels in scenarios.items():
+            for concurrency, result in levels.items():
+                base = baseline.get(size, {}).get(name, {}).get(concurrency)
+                if base is None:
+                    continue
+                label = f'{name} ({size} posts, c={concurrency})'
+                if result['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{label}: p95 {base['p95_ms']}ms -> {result['p95_ms']}ms")
+                if result['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+                    regressions.append(f"{label}: throughput {base['throughput_rps']} -> {result['throughput_rps']} req/s")
+                if result['queries_per_request'] > base['queries_per_request']:
+                    regressions.append(f"{label}: queries per request "
+                                       f"{base['queries_per_request']} -> {result['queries_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the routes of the blog webapp')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100_000], help='number of posts in the DB')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db-dir', default=os.path.join(tempfile.gettempdir(), 'myblog-bench'))
+    parser.add_argument('--bcrypt-rounds', type=int, default=Config.BCRYPT_LOG_ROUNDS)
+    parser.add_argument('--page-cache', action='store_true', help='enable the page cache (memory backend)')
+    parser.add_argument('--async-reads', action='store_true', help='serve the read routes with the async views')
+    parser.add_argument('--url', help='send the requests to the server running at this URL instead of the app '
+                                      '(like http://127.0.0.1:8000), the server must use the generated DB')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown before a regression')
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regression compared to the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Import time budget of the webapp (see README.md in this folder)
+#
+# Each scenario runs in a new interpreter with "python -X importtime", which reports the time spent importing
+# each module. We sum these times (the median of several runs), compare them to the budget of the scenario, and
+# check that the heavy dependencies loaded on first use (Pillow, bcrypt, Flask-Mail...) were not imported.
+# The imported modules are read from sys.modules at the end of the scenario : -X importtime also reports the
+# failed imports, like the optional imports of the third-party packages (urllib3 tries brotli), which do not count.
+#
+# The same check runs with the tests (tests/test_import_time.py).
+
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The budgets are relative to the import time of the frameworks the webapp is built on (measured in the same run),
+# so the check does not depend on the speed of the machine : they bound what the webapp adds on top of them
+BASELINE = 'import flask, flask_sqlalchemy, flask_login'
+
+# Scenarios : name -> (code run in a new interpreter, import time budget as a multiple of the baseline)
+SCENARIOS = {
+    'import': ('import myblog', 1.4),
+    'db_script': ('from myblog import create_app, models; create_app(register_blueprints=False)', 1.5),
+    'create_app': ('from myblog import create_app; create_app()', 1.9),
+}
+
+# Modules imported on first use only, they must not be imported by any scenario
+LAZY_MODULES = ('PIL', 'bcrypt', 'flask_mail', 'smtplib', 'brotli')
+
+# Modules of the routes and forms, they must not be imported by the scenarios that do not register the blueprints
+ROUTES_MODULES = ('wtforms', 'flask_wtf', 'email_validator')
+
+
+# Run some code with -X importtime, and return the total import time in ms and the names of the imported modules
+# The app is created on an in-memory DB, so that the scenarios do not create or upgrade a DB file.
+def measure(code):
+    code = f"{code}\nimport sys\nprint('\\n'.join(sys.modules))"
+    env = dict(os.environ, DATABASE_URL='sqlite://')
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=APP_DIR, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f'{code!r} failed :\n{process.stderr}')
+    total_us = 0
+    # lines like "import time:       412 |       1096 |   flask.app", after a header line
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, _ = line[len('import time:'):].split('|')
+        total_us += int(self_us)
+    return total_us / 1000, set(process.stdout.split())
+
+
+def imported(modules, packages):
+    return sorted(name for name in modules if name.split('.')[0] in packages)
+
+
+# Median of the import times of several runs, and the modules imported by the last one
+# A first run is not counted : it may have to compile the modules changed since the last run.
+def median_measure(code, repeat):
+    measure(code)
+    times = []
+    for _ in range(repeat):
+        total_ms, modules = measure(code)
+        times.append(total_ms)
+    return statistics.median(times), modules
+
+
+def run(args):
+    results = {}
+    failures = []
+    baseline_ms, _ = median_measure(BASELINE, args.repeat)
+    print(f"{'baseline':<12} {baseline_ms:>8.1f}ms  ({BASELINE})")
+    for name in args.scenarios:
+        code, ratio = SCENARIOS[name]
+        budget = baseline_ms * ratio * args.scale
+        total_ms, modules = median_measure(code, args.repeat)
+
+        unexpected = imported(modules, LAZY_MODULES)
+        if 'create_app()' not in code:
+            unexpected += imported(modules, ROUTES_MODULES)
+        results[name] = {'import_ms': round(total_ms, 1), 'budget_ms': round(budget, 1), 'modules': len(modules)}
+        print(f'{name:<12} {total_ms:>8.1f}ms  budget={budget:.0f}ms  modules={len(modules)}')
+
+        if total_ms > budget:
+            failures.append(f'{name}: {total_ms:.1f}ms, over the budget of {budget:.0f}ms')
+        if unexpected:
+            failures.append(f"{name}: imports {', '.join(unexpected)}")
+    return results, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of the blog webapp')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario, the median is used')
+    parser.add_argument('--scale', type=float, default=1.0, help='factor applied to the budgets')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    results, failures = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    for failure in failures:
+        print(f'FAILED {failure}')
+    if failures:
+        sys.exit(1)
+    print('All the scenarios are within their import time budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import pytest
+
+from myblog import create_app, db, hasher
+from myblog.config import Config
+from myblog.models import BlogPost, User
+from myblog.posts.counters import recount_posts
+
+# Fixtures of the webapp tests (in the tests folder), run from the flask_app folder with :    python -m pytest
+#
+# Each test gets its own app with a new SQLite DB in a temporary folder. The app runs offline (no mail sent, no
+# background threads) and with the query budget of the listings, so a route running one query per displayed post
+# (N+1 queries) fails its tests with a QueryBudgetExceeded error (see query_budget.py).
+
+
+PASSWORD = 'password'
+
+# Max number of SQL queries of the listings : the content version, the total (or the user) and the page of posts,
+# plus the load of the logged user when it is not in the user cache
+LISTING_QUERY_BUDGET = 4
+
+
+def testing_config(db_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+        SQLALCHEMY_REPLICA_URI = None
+        DB_PROFILE = 'sqlite'
+        MAIL_USERNAME = 'test'
+        MAIL_PASSWORD = 'test'
+        MAIL_SUPPRESS_SEND = True
+        MAIL_QUEUE_ENABLED = False
+        BCRYPT_LOG_ROUNDS = 4
+        HASHING_POOL_WORKERS = 0
+        AVATAR_WORKERS = 0
+        ASYNC_READS = False
+        ADMISSION_CONTROL = False
+        INSTRUMENTATION_ENABLED = False
+        PAGE_CACHE_BACKEND = None
+        USER_CACHE_BACKEND = 'memory'
+        POSTS_PAGINATION = 'pages'
+        TEMPLATE_BYTECODE_CACHE = None
+        TEMPLATE_PRELOAD = False
+        QUERY_BUDGET = {
+            'posts.get_posts_handler': LISTING_QUERY_BUDGET,
+            'posts.search_posts_handler': LISTING_QUERY_BUDGET,
+        }
+    return TestConfig
+
+
+# Config values changed for the tests of a module, by overriding this fixture in the module
+@pytest.fixture
+def app_config():
+    return {}
+
+
+# Create apps on the DB of the test (several apps on the same DB are like several processes)
+@pytest.fixture
+def make_app(tmp_path, app_config):
+    apps = []
+
+    def make():
+        app = create_app(type('TestConfig', (testing_config(tmp_path / 'posts.db'),), app_config))
+        apps.append(app)
+        return app
+    yield make
+    for app in apps:
+        db.dispose_engines(app)
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+# Three users with one post each, so that every post of a listing page has a different author
+# Returns the ids of the users (their emails are author<i>@example.com)
+@pytest.fixture
+def authors(app):
+    with app.app_context():
+        password_hash = hasher.generate_password_hash(PASSWORD)
+        users = [User(username=f'author{i}', email=f'author{i}@example.com', password_hash=password_hash)
+                 for i in range(3)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([BlogPost(title=f'Post {i}', content=f'Content of the post number {i}', user_id=user.id)
+                            for i, user in enumerate(users)])
+        db.session.flush()
+        recount_posts(db.session)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+# Log the test client in as the given user
+@pytest.fixture
+def login(client):
+    def login_as(email, password=PASSWORD):
+        response = client.post('/login', data={'email': email, 'password': password})
+        assert response.status_code == 302, 'login failed'
+        return response
+    return login_as
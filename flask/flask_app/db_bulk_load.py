@@ -0,0 +1,34 @@
+import argparse
+import time
+
+import bcrypt
+
+from myblog import create_app, db
+from myblog.bulk_load import load_synthetic_data
+# imported for its side effect : the full-text index is created and dropped with the tables
+from myblog.posts import search  # noqa: F401
+
+# This script creates a large synthetic DB, to reproduce performance issues with a realistic volume of data :
+#     python db_bulk_load.py --users 100000 --posts 10000000 --seed 42
+# All the users have the password "password".
+# The tables are recreated from scratch, so the existing data is lost.
+
+parser = argparse.ArgumentParser(description='Recreate the blog DB with generated users and posts')
+parser.add_argument('--users', type=int, default=1000)
+parser.add_argument('--posts', type=int, default=10000)
+parser.add_argument('--seed', type=int, default=0, help='same seed, same data')
+parser.add_argument('--batch-size', type=int, default=10000, help='rows per INSERT')
+args = parser.parse_args()
+
+app = create_app(register_blueprints=False)
+with app.app_context():
+    # drop existing DB and create the DB tables from the Python model classes
+    db.drop_all()
+    db.create_all()
+
+    # a single hash with a low cost, the users of a test DB do not need a strong hash
+    password_hash = bcrypt.hashpw(b'password', bcrypt.gensalt(4)).decode('utf-8')
+
+    start = time.perf_counter()
+    load_synthetic_data(db.engine, args.users, args.posts, password_hash, args.seed, args.batch_size)
+    print(f'Loaded {args.users} users and {args.posts} posts in {time.perf_counter() - start:.1f}s')
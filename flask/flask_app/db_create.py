@@ -1,10 +1,17 @@
-from myblog import db
+from myblog import create_app, db
+# imported for their side effects : the models define the tables, and the search module adds the full-text index
+# to them (created and dropped with the tables)
+from myblog import models  # noqa: F401
+from myblog.posts import search  # noqa: F401
 
 # This can be run to destroy and recreate from scratch the database from the model.
 # It is typically used only once before the launch of the webapp.
+# To create a DB with a large volume of generated data, use db_bulk_load.py instead.
 
-# drop existing DB
-db.drop_all()
+app = create_app(register_blueprints=False)
+with app.app_context():
+    # drop existing DB
+    db.drop_all()
 
-# create the DB tables from the Python model classes
-db.create_all()
+    # create the DB tables from the Python model classes
+    db.create_all()
@@ -0,0 +1,26 @@
+import argparse
+import sys
+
+from myblog import create_app, db
+from myblog.export.utils import EXPORTS, FORMATS, export_chunks
+
+# This script exports a table of the DB as NDJSON or CSV, to the standard output or to a file :
+#     python db_export.py posts --format csv --output posts.csv
+# The rows are streamed from the DB by batches, so it works with tables that do not fit in memory.
+
+parser = argparse.ArgumentParser(description='Export a table of the blog DB')
+parser.add_argument('kind', choices=sorted(EXPORTS))
+parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+parser.add_argument('--output', help='output file (default to the standard output)')
+parser.add_argument('--batch-size', type=int, default=1000)
+args = parser.parse_args()
+
+app = create_app(register_blueprints=False)
+with app.app_context():
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        for chunk in export_chunks(db.engine, args.kind, args.format, args.batch_size):
+            output.write(chunk)
+    finally:
+        if args.output:
+            output.close()
@@ -1,11 +1,18 @@
+from myblog import create_app
 from myblog.models import User, BlogPost
 
 # This is a simple script to show the content of all tables in the DB
+# The rows are loaded by batches of 1000 with yield_per() instead of loading whole tables in memory
+# (see db_export.py to export the tables in NDJSON or CSV)
 
-# print all users
-users = User.query.all()
-print('Users:', *users, sep='\n    ')
+app = create_app(register_blueprints=False)
+with app.app_context():
+    # print all users
+    print('Users:')
+    for user in User.query.yield_per(1000):
+        print('    ', user)
 
-# print all posts
-posts = BlogPost.query.all()
-print('\nPosts:', *posts, sep='\n    ')
+    # print all posts
+    print('\nPosts:')
+    for post in BlogPost.query.yield_per(1000):
+        print('    ', post)
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+
+# Config of the gunicorn server running the webapp in production :
+#     gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Each worker is a process with its own threads (gthread worker), the number of requests served at the same time
+# is workers * threads. The settings can be changed with GUNICORN_* env variables.
+#
+# The app is loaded once by the master process before forking the workers (preload_app), so the workers start
+# immediately and share the memory of the loaded code. The master never connects to the DB, and each worker
+# drops the DB connections it could inherit right after the fork (post_fork), so no connection is shared between
+# processes. The filter of the usernames and emails taken (see myblog/users/availability.py) is not loaded by the
+# master either, but by each worker right after the fork, before it serves requests. The thread and process pools
+# of the app (hashing, avatars, mail queue) are created by each worker on first use.
+#
+# Workers are recycled after max_requests requests (with a random jitter so they do not all restart at the same
+# time), to bound the memory growth of long-running processes.
+#
+# Reloads without downtime :
+#  - kill -HUP <master pid> : reloads this config and replaces the workers one by one, the new workers are forked
+#    from the master, so with preload_app they run the code loaded when the master started
+#  - to deploy new code : kill -USR2 <master pid> starts a new master (with the new code) next to the old one,
+#    then kill -TERM <old master pid> once the new workers are ready, the old workers finish their requests
+
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+# the master does not load the availability filter when it creates the app, the workers do (post_fork)
+os.environ.setdefault('AVAILABILITY_FILTER_PRELOAD', '0')
+
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 500))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))             # a worker silent for longer is killed
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))  # time to finish the requests on reload
+# max time spent sending the queued emails when a worker exits, it must end before gunicorn kills the worker
+# at the end of graceful_timeout (which also includes the time to finish the requests)
+mail_flush_timeout = float(os.environ.get('GUNICORN_MAIL_FLUSH_TIMEOUT', graceful_timeout / 3))
+keepalive = 5
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+
+# In the worker, right after the fork : drop the DB connections inherited from the master (if any), and load the
+# availability filter
+def post_fork(server, worker):
+    from myblog import availability, db
+    from wsgi import app
+    db.dispose_engines(app)
+    availability.preload(app)
+
+
+# Before a worker exits (recycled, reloaded or stopped) : send the emails still in the queue, within
+# mail_flush_timeout (the messages not sent by then are lost, and logged)
+def worker_exit(server, worker):
+    from myblog import mail_queue
+    mail_queue.flush(timeout=min(mail_flush_timeout, graceful_timeout - 1))
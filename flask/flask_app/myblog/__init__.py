@@ -1,34 +1,76 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
 from flask_login import LoginManager
-from flask_mail import Mail
 
+from myblog.admission import AdmissionControl
+from myblog.aio import AsyncDatabase
+from myblog.cache import PageCache, UserCache
+from myblog.compression import ResponseCompression
 from myblog.config import Config
+from myblog.database import Database
+from myblog.instrumentation import Instrumentation
+from myblog.mail_queue import LazyMail, MailQueue
+from myblog.query_budget import QueryBudget
+from myblog.static_assets import StaticAssets
+from myblog.templating import TemplateCache
+from myblog.users.availability import UserAvailability
+from myblog.users.hashing import PasswordHasher
+from myblog.users.images import AvatarPipeline
 
 
 # Create the DB handler required to define the DB model and interact with the DB
-db = SQLAlchemy()
+# It is a Flask-SQLAlchemy object with tuned engines and reads sent to a replica if any (see database.py)
+db = Database()
 
-# Bcrypt object to hash passwords and check a stored hash against a potential password from the user
-bcrypt = Bcrypt()
+# Async engine used by the read routes in the async serving mode (see aio.py)
+async_db = AsyncDatabase()
+
+# Password hasher to hash passwords and check a stored hash against a potential password from the user
+# The bcrypt computations run in a pool of processes so they do not block the other requests
+hasher = PasswordHasher()
 
 # Login manager to handle user sessions
 login_manager = LoginManager()
 login_manager.login_view = 'users.login_handler'     # handler to redirect to for endpoints with login required
 login_manager.login_message_category = 'info'  # set alert-info class to the message div when redirecting to login page 
 
-# Mail manager
-mail = Mail()
+# Mail manager (Flask-Mail is imported when the first email is sent)
+mail = LazyMail()
+
+# Queue to send the emails in background threads instead of the request
+mail_queue = MailQueue()
+
+# Optional limit of SQL queries per request, used in tests to detect N+1 queries
+query_budget = QueryBudget()
+
+# Optional per-endpoint metrics (latency, SQL queries, template rendering)
+instrumentation = Instrumentation()
+
+# Optional limits of the requests processed at the same time, with 503 responses when overloaded
+admission = AdmissionControl()
+
+# Optional cache of the rendered posts listing pages
+page_cache = PageCache()
+
+# Short-lived cache of the users loaded by the login manager on every request
+user_cache = UserCache()
 
-# import the routes so Flask knows about them when running the blog webapp with app.run()
-from myblog.users.routes import users_blueprint
-from myblog.posts.routes import posts_blueprint
-from myblog.common.routes import common_blueprint
-from myblog.errors.handlers import errors_blueprint
+# Checks of the usernames and emails already taken, with an in-memory filter in front of the DB
+availability = UserAvailability()
 
+# Processing of the uploaded profile pictures (resized in background threads)
+avatars = AvatarPipeline()
 
-def create_app(config_class=Config):
+# Fingerprinted URLs and long-lived caching of the static files
+static_assets = StaticAssets()
+
+# Compression of the responses (gzip or brotli)
+compression = ResponseCompression()
+
+# Persistent cache of the compiled templates, shared by the worker processes
+template_cache = TemplateCache()
+
+
+def create_app(config_class=Config, register_blueprints=True):
     # Create a Flask object representing our webapp
     app = Flask(__name__)
     app.config.from_object(config_class)
@@ -41,14 +83,44 @@ def create_app(config_class=Config):
     # They are created outside of the create_app method and are app-independent
     # Here we bind them to our specific app object
     db.init_app(app)
-    bcrypt.init_app(app)
+    async_db.init_app(app)
+    hasher.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    query_budget.init_app(app)
+    instrumentation.init_app(app)
+    admission.init_app(app)
+    page_cache.init_app(app)
+    user_cache.init_app(app)
+    availability.init_app(app)
+    mail_queue.init_app(app)
+    avatars.init_app(app)
+    static_assets.init_app(app)
+    compression.init_app(app)
+    template_cache.init_app(app)
+
+    # add the post counters to a DB created before them (see posts/counters.py)
+    if app.config.get('DB_AUTO_UPGRADE'):
+        from myblog.posts.counters import upgrade_counters
+        with app.app_context():
+            upgrade_counters()
+
+    # the DB scripts only need the models, they skip the import of the routes and forms (and of their dependencies)
+    if not register_blueprints:
+        return app
+
+    # import the routes so Flask knows about them when running the blog webapp with app.run()
+    from myblog.users.routes import users_blueprint
+    from myblog.posts.routes import posts_blueprint
+    from myblog.common.routes import common_blueprint
+    from myblog.errors.handlers import errors_blueprint
+    from myblog.export.routes import export_blueprint
 
     # register all blueprints for this app
     app.register_blueprint(users_blueprint)
     app.register_blueprint(posts_blueprint)
     app.register_blueprint(common_blueprint)
     app.register_blueprint(errors_blueprint)
+    app.register_blueprint(export_blueprint)
 
     return app
\ No newline at end of file
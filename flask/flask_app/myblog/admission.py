@@ -0,0 +1,111 @@
+import threading
+import time
+
+from flask import current_app, g, request
+from werkzeug.exceptions import ServiceUnavailable
+
+
+# Admission control and load shedding
+#
+# When a burst of requests arrives, the slow ones (bcrypt hashes, DB queries) pile up in the worker threads and
+# all the routes become slow together, until every request times out. With ADMISSION_CONTROL set, the endpoints
+# are grouped in pools (ADMISSION_POOLS), each with :
+#  - a max number of requests processed at the same time (concurrency)
+#  - a bounded queue of requests waiting for a slot (queue), each waiting at most timeout seconds
+# A request that finds the queue full, or that waits longer than the timeout, is rejected immediately with a 503
+# response and a Retry-After header, without running its handler. An overloaded pool (like the logins) then
+# only slows down its own endpoints, and the other routes keep being served.
+#
+# The endpoints of a pool are endpoint names ('users.login_handler') or blueprint names ('users'), optionally
+# only for some methods. The endpoints in no pool are not limited. The limits are per process.
+# The rejections, queue lengths and wait times are recorded in the instrumentation (admission.<pool>.*), the wait
+# times include the time waited by the requests rejected at the end of the timeout.
+
+
+class AdmissionRejected(ServiceUnavailable):
+    description = 'The server is overloaded, please try again in a few seconds.'
+
+
+class AdmissionPool:
+
+    def __init__(self, name, concurrency, queue=0, timeout=1.0, endpoints=(), methods=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue
+        self.timeout = timeout
+        self.endpoints = set(endpoints)
+        self.methods = set(methods) if methods else None
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def matches(self, endpoint, blueprint, method):
+        if self.methods is not None and method not in self.methods:
+            return False
+        return endpoint in self.endpoints or blueprint in self.endpoints
+
+    # Take a slot, waiting in the queue if needed : return (True if a slot was taken, time waited)
+    def acquire(self):
+        start = time.monotonic()
+        with self.condition:
+            if self.active >= self.concurrency:
+                if self.waiting >= self.queue_size:
+                    return False, time.monotonic() - start
+                self.waiting += 1
+                try:
+                    deadline = start + self.timeout
+                    while self.active >= self.concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False, time.monotonic() - start
+                        self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+        return True, time.monotonic() - start
+
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify()
+
+
+class AdmissionControl:
+
+    def __init__(self, app=None):
+        self.pools = []
+        self.retry_after = 1
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('ADMISSION_CONTROL'):
+            return
+        self.pools = [AdmissionPool(name, **options) for name, options in app.config['ADMISSION_POOLS'].items()]
+        self.retry_after = app.config.get('ADMISSION_RETRY_AFTER', 1)
+        app.extensions['admission_control'] = self
+        app.before_request(self._admit)
+        app.teardown_request(self._release)
+
+    def pool_for(self, endpoint, blueprint, method):
+        return next((pool for pool in self.pools if pool.matches(endpoint, blueprint, method)), None)
+
+    def _admit(self):
+        pool = self.pool_for(request.endpoint, request.blueprint, request.method)
+        if pool is None:
+            return
+        admitted, waited = pool.acquire()
+        instrumentation = current_app.extensions.get('instrumentation')
+        if instrumentation:
+            instrumentation.gauge(f'admission.{pool.name}.active', pool.active)
+            instrumentation.gauge(f'admission.{pool.name}.waiting', pool.waiting)
+            instrumentation.observe(f'admission.{pool.name}.wait', waited)
+            instrumentation.incr(f"admission.{pool.name}.{'admitted' if admitted else 'rejected'}")
+        if not admitted:
+            raise AdmissionRejected(retry_after=self.retry_after)
+        g.admission_pool = pool
+
+    def _release(self, exception=None):
+        pool = g.pop('admission_pool', None)
+        if pool is not None:
+            pool.release()
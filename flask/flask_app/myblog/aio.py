@@ -0,0 +1,101 @@
+import functools
+import os
+
+from flask import current_app
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool
+
+
+# Async serving mode
+#
+# With ASYNC_READS set, the read routes of the posts (listing and search) are replaced by async views running their
+# queries on an async SQLAlchemy engine (aiosqlite for SQLite, asyncpg for PostgreSQL), see posts/async_routes.py.
+# The app can be served by an ASGI server with asgi.py (the app is wrapped by an ASGI adapter).
+#
+# This mode does NOT serve more requests at the same time than the sync mode : Flask 2.0 runs each async view in
+# its own event loop, and the request thread waits for that loop to finish (and the ASGI adapter runs the whole
+# WSGI app in a thread pool), so a request waiting on the DB still holds a thread. It only moves the queries to the
+# async drivers, and it is slower than the sync mode (see benchmarks/README.md). Serving more requests than
+# threads would need an async framework (like Quart) instead of Flask.
+#
+# Since each view has its own event loop :
+#  - the async engine does not keep a pool of connections (NullPool) : the asyncpg connections are tied to the
+#    event loop that opened them, and the asyncio pool of SQLAlchemy (AsyncAdaptedQueuePool) only works within
+#    a single event loop. The new SQLite connections only get the settings that matter for reads (busy timeout,
+#    memory-mapped I/O), the journal mode is stored in the DB file and the other pragmas are for the writes or
+#    for a page cache that a connection of a single request does not reuse.
+#  - db.session is scoped to the thread, and the event loop of the view runs in another thread, so the views must
+#    not use it : the logged user is loaded before the view starts (async_read_view), and the views only use
+#    the async session
+#
+# The reads go to the replica if there is one (SQLALCHEMY_REPLICA_URI), like the GET requests of the sync routes.
+
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+
+# URL of the async engine from the URL of the sync engine, with the same driver adjustments as Flask-SQLAlchemy
+# (relative SQLite paths are relative to the app folder)
+def async_url(uri, root_path):
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {backend} databases')
+    url = url.set(drivername=ASYNC_DRIVERS[backend])
+    if backend == 'sqlite' and url.database and url.database != ':memory:' and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(root_path, url.database))
+    return url
+
+
+# Pragmas of the new SQLite connections of the async engine (see above)
+def async_sqlite_pragmas(config):
+    mmap_size = int(config.get('SQLITE_MMAP_SIZE', 0))
+    return [f'PRAGMA mmap_size={mmap_size}'] if mmap_size else []
+
+
+class AsyncDatabase:
+
+    def __init__(self, app=None):
+        self.engine = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('ASYNC_READS'):
+            return
+        # the asyncio extension of SQLAlchemy (and its driver) is only imported in the async mode
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        uri = app.config.get('SQLALCHEMY_REPLICA_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+        url = async_url(uri, app.root_path)
+        options = {'poolclass': NullPool}
+        pragmas = []
+        if url.get_backend_name() == 'sqlite' and app.config.get('DB_PROFILE', 'sqlite') == 'sqlite':
+            options['connect_args'] = {'timeout': app.config.get('SQLITE_BUSY_TIMEOUT', 5)}
+            pragmas = async_sqlite_pragmas(app.config)
+        self.engine = create_async_engine(url, **options)
+        if pragmas:
+            @event.listens_for(self.engine.sync_engine, 'connect')
+            def apply_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+        app.extensions['async_db'] = self
+
+    # New async session, to use with "async with"
+    def session(self):
+        from sqlalchemy.ext.asyncio import AsyncSession
+        return AsyncSession(self.engine)
+
+
+# Decorator of the async views : the logged user is loaded by the request thread (with db.session), then the
+# view runs in its event loop
+def async_read_view(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        current_user._get_current_object()
+        return current_app.ensure_sync(view)(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,153 @@
+import contextlib
+import itertools
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from myblog.models import BlogPost, User
+from myblog.posts.counters import recount_posts
+
+
+# Bulk loading of large datasets, and generation of realistic synthetic data
+#
+# Adding rows one by one with db.session.add() creates an ORM object per row and sends one INSERT per row.
+# Here the rows are plain dicts inserted by batches with executemany (Core insert), in large transactions, and
+# the secondary indexes (and the full-text index triggers) are created only once all the rows are loaded, even if
+# the load fails. The post counters are computed at the end of the load.
+#
+# The rows are inserted with their ids (the posts refer to the ids of the users), so on PostgreSQL the sequences of
+# the ids are moved after the loaded rows at the end.
+#
+# The generators are deterministic : the same seed always gives the same dataset.
+
+
+WORDS = ('lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore '
+         'et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi aliquip '
+         'ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse cillum eu fugiat nulla '
+         'pariatur excepteur sint occaecat cupidatat non proident sunt culpa qui officia deserunt mollit anim '
+         'id est laborum python flask database query index cache server request latency').split()
+
+
+# Users user0000001, user0000002... all with the same password hash (computing one hash per user is too slow)
+def generate_users(count, password_hash):
+    for i in range(1, count + 1):
+        yield {
+            'id': i,
+            'username': f'user{i:07d}',
+            'email': f'user{i:07d}@example.com',
+            'image_file': 'default.jpg',
+            'password_hash': password_hash,
+        }
+
+
+# Posts spread over the given period in chronological order
+#  - a few users write most of the posts (power law distribution of the authors)
+#  - the content size follows a log-normal distribution (most posts are short, a few are very long)
+def generate_posts(count, user_count, seed=0, start=None, end=None):
+    rng = random.Random(seed)
+    end = end or datetime(2021, 1, 1)
+    start = start or end - timedelta(days=5 * 365)
+    step = (end - start) / max(count, 1)
+
+    # the contents are slices of a long random text, much faster than generating words for each post
+    corpus = ' '.join(rng.choice(WORDS) for _ in range(50_000))
+    for i in range(1, count + 1):
+        size = min(20_000, max(20, int(rng.lognormvariate(math.log(600), 1.0))))
+        offset = rng.randrange(0, len(corpus) - size)
+        yield {
+            'id': i,
+            'title': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 8))).capitalize()[:100],
+            'content': corpus[offset:offset + size].strip() or 'empty',
+            'created_on': start + step * i + timedelta(seconds=rng.uniform(0, step.total_seconds())),
+            'user_id': int(user_count * rng.random() ** 3) + 1,
+        }
+
+
+# Drop the secondary indexes (and full-text triggers) of the posts table during the load, and create them after
+# Maintaining them row by row is much slower than building them once at the end.
+# They are created again if the load fails, with the rows loaded so far in the full-text index.
+@contextlib.contextmanager
+def deferred_indexes(connection):
+    from myblog.posts.search import SQLITE_DDL
+
+    table = BlogPost.__table__
+    sqlite = connection.dialect.name == 'sqlite'
+    for index in table.indexes:
+        index.drop(connection, checkfirst=True)
+    if sqlite:
+        for trigger in ('blog_post_fts_insert', 'blog_post_fts_delete', 'blog_post_fts_update'):
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+    try:
+        yield
+    finally:
+        print('Creating indexes...', file=sys.stderr)
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+        if sqlite:
+            for statement in SQLITE_DDL:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')"))
+
+
+# Disable the durability of the SQLite writes during the load (if it fails we start again), and restore it before
+# the connection goes back to the pool of the engine
+@contextlib.contextmanager
+def unsynchronized(connection):
+    if connection.dialect.name != 'sqlite':
+        yield
+        return
+    synchronous = connection.execute(text('PRAGMA synchronous')).scalar()
+    connection.execute(text('PRAGMA synchronous=OFF'))
+    try:
+        yield
+    finally:
+        connection.execute(text(f'PRAGMA synchronous={int(synchronous)}'))
+
+
+# Move the sequences of the ids after the loaded rows (PostgreSQL), so that the next inserts of the app get new ids
+def reset_id_sequences(connection):
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in (User.__table__, BlogPost.__table__):
+        connection.execute(text(f"SELECT setval(pg_get_serial_sequence('\"{table.name}\"', 'id'), "
+                                f"COALESCE(MAX(id), 0) + 1, false) FROM \"{table.name}\""))
+
+
+# Insert the rows of an iterable of dicts in a table, with one executemany per batch
+# and one transaction every transaction_size rows
+def bulk_insert(connection, table, rows, batch_size=10_000, transaction_size=500_000, label=None):
+    label = label or table.name
+    statement = table.insert()
+    start = time.perf_counter()
+    count = 0
+    transaction = connection.begin()
+    try:
+        for batch in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+            connection.execute(statement, batch)
+            count += len(batch)
+            if count % transaction_size < batch_size:
+                transaction.commit()
+                transaction = connection.begin()
+            elapsed = time.perf_counter() - start
+            print(f'\r{label}: {count:,} rows ({count / elapsed:,.0f} rows/s)', end='', file=sys.stderr)
+    except BaseException:
+        # the rows of the committed transactions stay in the DB
+        transaction.rollback()
+        raise
+    transaction.commit()
+    print(file=sys.stderr)
+    return count
+
+
+# Load a synthetic dataset in the DB (the tables must exist and be empty)
+def load_synthetic_data(engine, user_count, post_count, password_hash, seed=0, batch_size=10_000):
+    with engine.connect() as connection, unsynchronized(connection):
+        with deferred_indexes(connection):
+            bulk_insert(connection, User.__table__, generate_users(user_count, password_hash), batch_size)
+            bulk_insert(connection, BlogPost.__table__, generate_posts(post_count, user_count, seed), batch_size)
+        reset_id_sequences(connection)
+        recount_posts(connection)
@@ -0,0 +1,261 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from flask import current_app, session
+from flask_login import current_user
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+
+# Cache backends
+#
+# Both backends have the same interface (get/set/delete/clear) and evict entries when :
+#  - their time-to-live (TTL) expired
+#  - the cache is full, in which case the least recently used (LRU) entries are removed first
+#
+# MemoryCacheBackend keeps the entries in the memory of the process (each worker process has its own cache, and
+# does not see the deletions made by the others).
+# SqliteCacheBackend keeps them in a local SQLite file, so all the worker processes of the machine share it.
+
+
+class MemoryCacheBackend:
+
+    def __init__(self, max_entries=1000, max_bytes=None, default_ttl=60):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.entries = OrderedDict()  # key -> (expiry, size, value), ordered from least to most recently used
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        size = len(value) if isinstance(value, (str, bytes)) else 1
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + ttl, size, value)
+            self.size += size
+            while self.entries and (len(self.entries) > self.max_entries
+                                    or (self.max_bytes is not None and self.size > self.max_bytes)):
+                self._remove(next(iter(self.entries)))
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        self.size -= self.entries.pop(key)[1]
+
+
+class SqliteCacheBackend:
+
+    def __init__(self, path, max_entries=10000, default_ttl=60):
+        self.path = path
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.local = threading.local()  # one connection per thread
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, value BLOB, expiry REAL, accessed REAL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)')
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute('SELECT value, expiry FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if row[1] < now:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+            return None
+        conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        conn = self._connect()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expiry, accessed) VALUES (?, ?, ?, ?)',
+                     (key, pickle.dumps(value), now + ttl, now))
+        count = conn.execute('SELECT count(*) FROM cache').fetchone()[0]
+        if count > self.max_entries:
+            conn.execute('DELETE FROM cache WHERE expiry < ?', (now,))
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+                         (max(0, count - self.max_entries),))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+
+
+# Create the cache backend described by the config, with the given prefix for the config keys
+# For example with prefix 'PAGE_CACHE' : PAGE_CACHE_BACKEND, PAGE_CACHE_TTL, PAGE_CACHE_MAX_ENTRIES...
+def create_backend(config, prefix):
+    backend = config.get(f'{prefix}_BACKEND')
+    if backend == 'memory':
+        return MemoryCacheBackend(max_entries=config.get(f'{prefix}_MAX_ENTRIES', 1000),
+                                  max_bytes=config.get(f'{prefix}_MAX_BYTES'),
+                                  default_ttl=config.get(f'{prefix}_TTL', 60))
+    if backend == 'sqlite':
+        return SqliteCacheBackend(config[f'{prefix}_PATH'],
+                                  max_entries=config.get(f'{prefix}_MAX_ENTRIES', 10000),
+                                  default_ttl=config.get(f'{prefix}_TTL', 60))
+    if backend is None:
+        return None
+    raise ValueError(f'Unknown cache backend for {prefix} : {backend}')
+
+
+# Cache of the rendered posts listing pages
+#
+# A cached page depends on :
+#  - the request parameters (user filter, page number or cursor)
+#  - the viewer, since the Edit/Delete buttons and the navigation bar depend on the logged user
+#  - the content of the posts, through version tokens
+#
+# Instead of finding and deleting all the cached pages impacted by a change, we change a version token that
+# is part of the cache key. There is a version for the global listing and one per user listing, so creating
+# a post of user 3 invalidates the global listing and the listing of user 3, but not the one of user 4.
+# The pages cached with the old versions are never read again and are evicted by the LRU/TTL policy.
+#
+# The versions must be seen by all the worker processes, or the other workers would keep serving the old pages
+# until their TTL. With the memory backend, only the pages are in the memory of each process, the versions are
+# kept in the SQLite file of PAGE_CACHE_PATH like with the sqlite backend. Both backends are local to the machine,
+# so with several machines the changes made on one are only seen by the others after PAGE_CACHE_TTL.
+class PageCache:
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.versions = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config, 'PAGE_CACHE')
+        self.versions = self.backend
+        if isinstance(self.backend, MemoryCacheBackend):
+            self.versions = SqliteCacheBackend(app.config['PAGE_CACHE_PATH'],
+                                               max_entries=app.config.get('PAGE_CACHE_MAX_ENTRIES', 10000))
+        app.extensions['page_cache'] = self
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def _version(self, name):
+        key = f'version:{name}'
+        version = self.versions.get(key)
+        if version is None:
+            # unknown (or evicted) version : use a new one, so no page cached before can be returned
+            version = uuid.uuid4().hex[:12]
+            self.versions.set(key, version, ttl=365 * 24 * 3600)
+        return version
+
+    # Cache key for a page of the posts listing, or None if this page must not be cached
+    def listing_key(self, user_id, page, cursor):
+        if not self.enabled or session.get('_flashes'):
+            # the flash messages are displayed only once, a page with flash messages is never cached
+            return None
+        viewer = current_user.id if current_user.is_authenticated else 'anon'
+        versions = self._version('posts') if user_id == -1 else self._version(f'posts:user:{user_id}')
+        build = current_app.config.get('BUILD_ID')
+        return f'posts:{build}:{versions}:user={user_id}:page={page}:cursor={cursor}:viewer={viewer}'
+
+    def get(self, key):
+        page = self.backend.get(key)
+        instrumentation = current_app.extensions.get('instrumentation')
+        if instrumentation:
+            instrumentation.incr('page_cache.hit' if page is not None else 'page_cache.miss')
+        return page
+
+    def set(self, key, page):
+        self.backend.set(key, page)
+
+    # Called after any change of the posts of a user (or of the user name and picture displayed in its posts)
+    def invalidate_posts(self, user_id):
+        if not self.enabled:
+            return
+        for name in ('posts', f'posts:user:{user_id}'):
+            self.versions.set(f'version:{name}', uuid.uuid4().hex[:12], ttl=365 * 24 * 3600)
+
+
+# Identity cache of the users loaded by the Flask-Login user loader
+#
+# The user loader runs on every request of a logged user, so instead of a SELECT each time we keep the columns
+# of the recently loaded users for a short time (USER_CACHE_TTL).
+# We cannot keep the User objects themselves, they are bound to the session of the request that loaded them.
+# Instead we rebuild a User from the cached columns and attach it to the current session without any query,
+# so it behaves like a loaded object (lazy relationships work, and changes are saved on commit).
+#
+# The password hash and the post count (updated by other requests) are not cached, they are loaded from the DB
+# only if they are accessed. Routes that modify a user must call invalidate() after the commit.
+class UserCache:
+
+    excluded_columns = ('password_hash', 'post_count')
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = create_backend(app.config, 'USER_CACHE')
+        app.extensions['user_cache'] = self
+
+    def load(self, model, user_id):
+        if self.backend is None:
+            return model.query.get(user_id)
+        instrumentation = current_app.extensions.get('instrumentation')
+        data = self.backend.get(f'user:{user_id}')
+        if data is not None:
+            if instrumentation:
+                instrumentation.incr('user_cache.hit')
+            user = model(**data)
+            make_transient_to_detached(user)
+            return model.query.session.merge(user, load=False)
+
+        if instrumentation:
+            instrumentation.incr('user_cache.miss')
+        user = model.query.get(user_id)
+        if user is not None:
+            self.backend.set(f'user:{user_id}', {attr.key: getattr(user, attr.key)
+                                                 for attr in inspect(model).column_attrs
+                                                 if attr.key not in self.excluded_columns})
+        return user
+
+    def invalidate(self, user_id):
+        if self.backend is not None:
+            self.backend.delete(f'user:{user_id}')
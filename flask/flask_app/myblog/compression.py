@@ -0,0 +1,108 @@
+import gzip
+import zlib
+
+from flask import current_app, request
+
+
+# Compression of the responses (rendered pages, JSON, exports...)
+#
+# The HTML pages are mostly repeated markup (the listing has a delete modal per post), so they compress very well.
+# When the client accepts it (Accept-Encoding), the responses with a compressible type (COMPRESS_MIMETYPES) are
+# compressed with brotli if the module is installed, or with gzip, at COMPRESS_LEVEL / COMPRESS_BROTLI_QUALITY.
+#  - responses smaller than COMPRESS_MIN_SIZE are sent as they are, the compression would not save anything
+#  - streamed responses (like the exports) are compressed chunk by chunk, each chunk is flushed so the client
+#    still receives the data progressively
+#  - the files served by send_file (static files) and the responses already encoded are not touched, the static
+#    files have their own precompressed versions (see static_assets.py)
+
+
+class ResponseCompression:
+
+    def __init__(self, app=None):
+        self.brotli = None
+        self.brotli_checked = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('COMPRESS_ENABLED'):
+            return
+        self.mimetypes = set(app.config.get('COMPRESS_MIMETYPES', ('text/html',)))
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', 4)
+        app.extensions['compression'] = self
+        app.after_request(self._compress)
+
+    # The brotli module is optional, and imported on first use
+    def _get_brotli(self):
+        if not self.brotli_checked:
+            try:
+                import brotli
+                self.brotli = brotli
+            except ImportError:
+                self.brotli = None
+            self.brotli_checked = True
+        return self.brotli
+
+    def _compress(self, response):
+        if (response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough
+                or 'Content-Encoding' in response.headers or response.mimetype not in self.mimetypes):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None and response.content_length < self.min_size:
+            return response
+        encodings = ['br', 'gzip'] if self._get_brotli() else ['gzip']
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            compressed = self._compress_data(data, encoding)
+            response.set_data(compressed)
+            instrumentation = current_app.extensions.get('instrumentation')
+            if instrumentation:
+                instrumentation.incr('compression.bytes_in', len(data))
+                instrumentation.incr('compression.bytes_out', len(compressed))
+        response.headers['Content-Encoding'] = encoding
+
+        # a strong ETag identifies the exact bytes, so the compressed version needs its own
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
+
+    def _compress_data(self, data, encoding):
+        if encoding == 'br':
+            return self.brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+    def _compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = self.brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+            compress, finish = compressor.compress, compressor.flush
+
+            def flush():
+                return compressor.flush(zlib.Z_SYNC_FLUSH)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = compress(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            # the response closes this generator, which must close the original one (stream_with_context...)
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
@@ -20,11 +20,144 @@ class Config:
     # Here we use SQLite that creates the DB in a local file in the current directory
     # When using mySQL or PostgreSQL the password and user are in the DB path, so it should
     # be provided via env variable instead
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///posts.db'  # 3 slashes is for relative path
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///posts.db')  # 3 slashes is for relative path
+    SQLALCHEMY_TRACK_MODIFICATIONS = False  # we do not use the modification signals, they have a cost
+
+    # Engine profile (see database.py) : 'sqlite' or 'server' (PostgreSQL, MySQL...)
+    DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = 20
+    DB_POOL_TIMEOUT = 10      # in seconds, max wait for a connection from the pool
+    DB_POOL_RECYCLE = 1800    # in seconds, server DBs close idle connections after some time
+    SQLITE_JOURNAL_MODE = 'WAL'
+    SQLITE_SYNCHRONOUS = 'NORMAL'
+    SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE = -64000  # negative value is in KiB, so 64MB
+    SQLITE_BUSY_TIMEOUT = 5     # in seconds
+
+    # Upgrade of an existing DB when the app is created : the tables and columns added since it was created
+    DB_AUTO_UPGRADE = True
+
+    # Optional read replica, used by the GET requests of these blueprints
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    REPLICA_READ_BLUEPRINTS = ('posts',)
+
+    # Async serving mode : the read routes of the posts use an async engine, to serve with asgi.py (see aio.py)
+    ASYNC_READS = os.environ.get('ASYNC_READS') == '1'
+
+    # Pagination of the posts listing
+    # 'pages' uses page numbers (LIMIT/OFFSET), fine for small tables
+    # 'keyset' uses next/prev cursors, with a constant cost whatever the page (cursor links always work)
+    POSTS_PER_PAGE = 3
+    POSTS_PAGINATION = os.environ.get('POSTS_PAGINATION', 'pages')
+    # ETag and Last-Modified on the posts listing, to answer 304 Not Modified when nothing changed (see posts/routes.py)
+    POSTS_CONDITIONAL_GET = True
+
+    # Max number of SQL queries per request, checked at the end of each request when set (see query_budget.py)
+    # Usually only set in tests, for example : QUERY_BUDGET = {'posts.get_posts_handler': 4, None: 10}
+    QUERY_BUDGET = None
+
+    # Per-endpoint instrumentation (see instrumentation.py)
+    # The stats are exposed as JSON on /_stats when INSTRUMENTATION_STATS_ENDPOINT is set, only to the requests from
+    # INSTRUMENTATION_STATS_ADDRESSES and to the logged users with an email in INSTRUMENTATION_STATS_ADMINS
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED') == '1'
+    INSTRUMENTATION_STATS_ENDPOINT = os.environ.get('INSTRUMENTATION_STATS_ENDPOINT') == '1'
+    INSTRUMENTATION_STATS_ADDRESSES = ('127.0.0.1', '::1')
+    INSTRUMENTATION_STATS_ADMINS = tuple(filter(None, os.environ.get('INSTRUMENTATION_STATS_ADMINS', '').split(',')))
+    INSTRUMENTATION_DUMP_PATH = os.environ.get('INSTRUMENTATION_DUMP_PATH')  # JSON dump written at exit
+    INSTRUMENTATION_MAX_SAMPLES = 1000  # latencies kept per endpoint for the percentiles
+    SLOW_QUERY_THRESHOLD = 0.1          # in seconds
+    SLOW_QUERY_LOG_SIZE = 100
+
+    # Admission control (see admission.py) : max requests processed at the same time by each pool of endpoints,
+    # max requests waiting for a slot and max wait in seconds, the other requests get a 503 response
+    ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL') == '1'
+    ADMISSION_POOLS = {
+        # logins, signups and password resets, limited by the bcrypt hashes
+        'auth': {'endpoints': ('users.login_handler', 'users.signup_handler', 'users.reset_password_handler'),
+                 'methods': ('POST',), 'concurrency': 4, 'queue': 16, 'timeout': 2.0},
+        # posts listing and search, limited by the DB
+        'reads': {'endpoints': ('posts.get_posts_handler', 'posts.search_posts_handler'),
+                  'concurrency': 16, 'queue': 64, 'timeout': 1.0},
+    }
+    ADMISSION_RETRY_AFTER = 2  # in seconds, sent in the Retry-After header of the 503 responses
+
+    # Cache of the rendered posts listing pages (see cache.py)
+    # The backend can be None (no cache), 'memory' (one cache per process) or 'sqlite' (shared by all the
+    # processes on the machine, stored in PAGE_CACHE_PATH)
+    # With both backends the invalidations are shared through PAGE_CACHE_PATH, by the processes of the machine only
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND')
+    PAGE_CACHE_PATH = os.environ.get('PAGE_CACHE_PATH', 'page_cache.db')
+    PAGE_CACHE_TTL = 300                    # in seconds
+    PAGE_CACHE_MAX_ENTRIES = 1000
+    PAGE_CACHE_MAX_BYTES = 50 * 1024 * 1024  # only for the memory backend
+
+    # Cache of the users loaded on each request by the login manager (see cache.py)
+    # Same backends as the page cache, the TTL is short since other processes do not see the invalidations
+    USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'memory')
+    USER_CACHE_PATH = os.environ.get('USER_CACHE_PATH', 'user_cache.db')
+    USER_CACHE_TTL = 30  # in seconds
+    USER_CACHE_MAX_ENTRIES = 10000
+
+    # Password hashing (see users/hashing.py)
+    # Existing hashes with a different cost are upgraded when their user logs in
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    HASHING_POOL_WORKERS = int(os.environ.get('HASHING_POOL_WORKERS', 2))  # 0 to hash in the request thread
+    HASHING_POOL_MAX_PENDING = 8  # hashes sent to the pool at the same time
+    HASHING_POOL_TIMEOUT = 5      # max wait in seconds for a slot in the pool, before a 503 response
+
+    # Filter of the usernames and emails already taken, to check the signups without a DB query (see users/availability.py)
+    AVAILABILITY_FILTER_ENABLED = True
+    AVAILABILITY_FILTER_CAPACITY = 100_000   # expected number of users, the filter grows with the users in DB
+    AVAILABILITY_FILTER_ERROR_RATE = 0.01    # proportion of free values that still need a DB query
+    AVAILABILITY_FILTER_REFRESH = 300        # in seconds, reload to see the users created by other processes
+    AVAILABILITY_FILTER_PRELOAD = os.environ.get('AVAILABILITY_FILTER_PRELOAD', '1') == '1'  # load it with the app
+
+    # Profile pictures (see users/images.py)
+    AVATAR_SIZES = (64, 125, 250)      # in pixels, each size is saved in JPEG and WebP
+    AVATAR_DEFAULT_SIZE = 125          # size used in the templates
+    AVATAR_MAX_BYTES = 5 * 1024 * 1024
+    AVATAR_MAX_PIXELS = 25_000_000     # checked before the image is decoded
+    AVATAR_WORKERS = 2                 # 0 to process the pictures in the request
+    # state of the background processing (last upload and failures), shared by the processes of the machine
+    AVATAR_STATUS_PATH = os.environ.get('AVATAR_STATUS_PATH', 'avatar_status.db')
+    AVATAR_STATUS_TTL = 24 * 3600      # in seconds
+
+    # Static files URLs with a content fingerprint, cached by browsers for STATIC_MAX_AGE (see static_assets.py)
+    STATIC_FINGERPRINTING = True
+    STATIC_MAX_AGE = 365 * 24 * 3600  # in seconds
+
+    # Compression of the responses with gzip, or brotli if installed (see compression.py)
+    COMPRESS_ENABLED = True
+    COMPRESS_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'text/csv', 'application/json',
+                          'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+    COMPRESS_MIN_SIZE = 500       # in bytes, smaller responses are not compressed
+    COMPRESS_LEVEL = 6            # gzip level, from 1 (fastest) to 9 (smallest)
+    COMPRESS_BROTLI_QUALITY = 4   # brotli quality, from 0 to 11 (much slower than gzip above 5 or 6)
+
+    # Folder of the compiled templates, shared by the processes and filled by 'flask templates precompile'
+    # (see templating.py), and loading of all the templates when the app is created
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE')
+    TEMPLATE_PRELOAD = os.environ.get('TEMPLATE_PRELOAD') == '1'
+    # Identifier of the deployed version in the ETags and cache keys of the pages, a hash of the templates and
+    # static files if it is not set (see templating.py)
+    BUILD_ID = os.environ.get('BUILD_ID')
+
+    # Rows read from the DB at a time by the streaming exports (see export/utils.py)
+    EXPORT_BATCH_SIZE = 1000
 
     # Config for sending emails
     MAIL_SERVER = 'smtp.googlemail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('EMAIL_USER')
-    MAIL_PASSWORD = os.environ.get('EMAIL_PWD')
\ No newline at end of file
+    MAIL_PASSWORD = os.environ.get('EMAIL_PWD')
+
+    # Background mail queue (see mail_queue.py)
+    MAIL_QUEUE_ENABLED = os.environ.get('MAIL_QUEUE_ENABLED', '1') == '1'
+    MAIL_QUEUE_WORKERS = 1
+    MAIL_QUEUE_MAX_SIZE = 1000
+    MAIL_QUEUE_BATCH_SIZE = 20  # messages sent over the same SMTP connection
+    MAIL_QUEUE_RETRIES = 3
+    MAIL_QUEUE_BACKOFF = 1.0    # in seconds, doubled after each retry
+    MAIL_QUEUE_TIMEOUT = 10     # in seconds, for each SMTP operation
\ No newline at end of file
@@ -0,0 +1,100 @@
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+
+
+# Database engine profiles and read/write split
+#
+# DB_PROFILE selects how the engines are configured :
+#  - 'sqlite' : pooled connections, with pragmas applied on each new connection (WAL journal so that readers do
+#               not block behind writers, synchronous=NORMAL, memory-mapped I/O, page cache and busy timeout)
+#  - 'server' : explicit pool sizing and pre-ping for server databases (PostgreSQL, MySQL...)
+#
+# If SQLALCHEMY_REPLICA_URI is set, it is added as the 'replica' bind, and the GET requests of the blueprints in
+# REPLICA_READ_BLUEPRINTS read from it. Everything else, and all the writes (flushes), use the primary.
+
+
+# Set the SQLAlchemy engine options matching the DB profile of the config
+def apply_engine_profile(config):
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    profile = config.get('DB_PROFILE', 'sqlite')
+    uri = config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if profile == 'sqlite' and ':memory:' not in uri and uri != 'sqlite://':
+        options.setdefault('poolclass', QueuePool)
+        options.setdefault('pool_size', config.get('DB_POOL_SIZE', 5))
+        options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 10))
+        connect_args = options.setdefault('connect_args', {})
+        connect_args.setdefault('timeout', config.get('SQLITE_BUSY_TIMEOUT', 5))
+        connect_args.setdefault('check_same_thread', False)  # pooled connections are used by several threads
+    elif profile == 'sqlite':
+        pass  # in-memory DB : keep the Flask-SQLAlchemy pool, a new connection would be a new empty DB
+    elif profile == 'server':
+        options.setdefault('pool_size', config.get('DB_POOL_SIZE', 10))
+        options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 20))
+        options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 10))
+        options.setdefault('pool_recycle', config.get('DB_POOL_RECYCLE', 1800))
+        options.setdefault('pool_pre_ping', True)
+    else:
+        raise ValueError(f'Unknown DB_PROFILE : {profile}')
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    if config.get('SQLALCHEMY_REPLICA_URI'):
+        config['SQLALCHEMY_BINDS'] = dict(config.get('SQLALCHEMY_BINDS') or {},
+                                          replica=config['SQLALCHEMY_REPLICA_URI'])
+
+
+def sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode={config.get('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"PRAGMA synchronous={config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA mmap_size={int(config.get('SQLITE_MMAP_SIZE', 0))}",
+        f"PRAGMA cache_size={int(config.get('SQLITE_CACHE_SIZE', -2000))}",
+        f"PRAGMA busy_timeout={int(config.get('SQLITE_BUSY_TIMEOUT', 5) * 1000)}",
+    ]
+
+
+# Session sending the reads of the GET requests of some blueprints to the replica
+class RoutingSession(SignallingSession):
+
+    def get_bind(self, mapper=None, clause=None):
+        binds = self.app.config.get('SQLALCHEMY_BINDS') or {}
+        if ('replica' in binds and not self._flushing and has_request_context()
+                and request.method in ('GET', 'HEAD')
+                and request.blueprint in self.app.config.get('REPLICA_READ_BLUEPRINTS', ())):
+            return self.app.extensions['sqlalchemy'].db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+
+class Database(SQLAlchemy):
+
+    pragmas = []
+
+    def init_app(self, app):
+        apply_engine_profile(app.config)
+        self.pragmas = sqlite_pragmas(app.config) if app.config.get('DB_PROFILE', 'sqlite') == 'sqlite' else []
+        super().init_app(app)
+
+    # Close the connections of the engines of the app, without using them
+    # Called in the processes forked by the server, the connections inherited from the parent process must not be
+    # used by several processes.
+    def dispose_engines(self, app):
+        binds = [None] + list(app.config.get('SQLALCHEMY_BINDS') or {})
+        for bind in binds:
+            self.get_engine(app, bind=bind).dispose()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super().create_engine(sa_url, engine_opts)
+        if engine.dialect.name == 'sqlite' and self.pragmas:
+            pragmas = list(self.pragmas)
+
+            @event.listens_for(engine, 'connect')
+            def apply_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+                cursor.close()
+        return engine
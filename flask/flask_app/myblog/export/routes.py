@@ -0,0 +1,22 @@
+from flask import Blueprint, Response, abort, current_app, stream_with_context
+from flask_login import login_required
+
+from myblog import db
+from myblog.export.utils import EXPORTS, FORMATS, export_chunks
+
+
+# The name "export" used for the blueprint is the prefix to use in all calls of url_for()
+export_blueprint = Blueprint('export', __name__)
+
+
+# Handler streaming a whole table as NDJSON or CSV, for example /export/posts.ndjson
+# The response is generated while it is sent, so it starts immediately and uses a constant memory.
+@export_blueprint.route('/export/<string:kind>.<string:fmt>', methods=['GET'])
+@login_required
+def export_handler(kind, fmt):
+    if kind not in EXPORTS or fmt not in FORMATS:
+        abort(404)
+    chunks = export_chunks(db.engine, kind, fmt, current_app.config['EXPORT_BATCH_SIZE'])
+    response = Response(stream_with_context(chunks), mimetype=FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={kind}.{fmt}'
+    return response
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from myblog.models import BlogPost, User
+
+
+# Streaming export of the DB tables
+#
+# Loading a whole table with Model.query.all() creates an ORM object for each row and keeps them all in memory.
+# Here we read the rows with a server-side cursor (stream_results) by batches of EXPORT_BATCH_SIZE rows, as plain
+# tuples without ORM objects, and each batch is formatted and sent before the next one is read.
+# The memory used does not depend on the size of the table, and the first rows are sent immediately.
+
+
+# Exported columns for each table (the emails and password hashes of the users are not exported)
+EXPORTS = {
+    'posts': (BlogPost.__table__, ('id', 'title', 'content', 'created_on', 'user_id')),
+    'users': (User.__table__, ('id', 'username', 'image_file')),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+# Generator of batches of rows of a table, read with a server-side cursor
+def stream_rows(engine, kind, batch_size):
+    table, columns = EXPORTS[kind]
+    statement = select(*[table.c[column] for column in columns]).order_by(table.c.id)
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=batch_size).execute(statement)
+        for batch in result.partitions(batch_size):
+            yield batch
+
+
+# Generator of text chunks (one per batch of rows) in the requested format
+def export_chunks(engine, kind, fmt, batch_size=1000):
+    _, columns = EXPORTS[kind]
+    if fmt == 'ndjson':
+        for batch in stream_rows(engine, kind, batch_size):
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in batch)
+    elif fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for batch in stream_rows(engine, kind, batch_size):
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # the header is sent even for an empty table
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        raise ValueError(f'Unknown export format : {fmt}')
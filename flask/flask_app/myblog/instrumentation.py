@@ -0,0 +1,254 @@
+import atexit
+import json
+import threading
+import time
+from collections import deque
+
+from flask import Blueprint, abort, current_app, g, jsonify, request, has_request_context
+from flask.signals import before_render_template, template_rendered
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request instrumentation of the webapp
+#
+# When INSTRUMENTATION_ENABLED is set, we record for each endpoint :
+#  - the latency of the requests (histogram and p50/p95/p99 on the most recent requests)
+#  - the number of SQL statements and the time spent in them (with SQLAlchemy engine events)
+#  - the time spent rendering templates (with the Flask template signals)
+# Queries slower than SLOW_QUERY_THRESHOLD are kept in a slow query log with their statement.
+#
+# The aggregates are available as JSON on the /_stats endpoint (only if INSTRUMENTATION_STATS_ENDPOINT is set,
+# and for the local requests and the admins only)
+# and are written to INSTRUMENTATION_DUMP_PATH when the process exits (if set).
+#
+# Other modules can also record their own metrics with incr(), gauge() and observe().
+
+
+# upper bounds in milliseconds of the latency histogram buckets (the last bucket is everything above)
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+# Nearest-rank percentile of a sorted list
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def _summary(samples):
+    values = sorted(samples)
+    return {
+        'p50_ms': _ms(percentile(values, 50)),
+        'p95_ms': _ms(percentile(values, 95)),
+        'p99_ms': _ms(percentile(values, 99)),
+        'max_ms': _ms(values[-1] if values else None),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+# Aggregated metrics of a single endpoint
+class EndpointStats:
+
+    def __init__(self, max_samples):
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=max_samples)
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+
+    def record(self, latency, status_code, sql_count, sql_time, render_time):
+        self.requests += 1
+        if status_code >= 500:
+            self.errors += 1
+        self.latencies.append(latency)
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if latency * 1000 <= bound),
+                      len(LATENCY_BUCKETS_MS))
+        self.histogram[bucket] += 1
+        self.sql_count += sql_count
+        self.sql_time += sql_time
+        self.render_time += render_time
+
+    def to_dict(self):
+        labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS_MS] + [f'>{LATENCY_BUCKETS_MS[-1]}ms']
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'latency': _summary(self.latencies),
+            'histogram': dict(zip(labels, self.histogram)),
+            'sql_per_request': round(self.sql_count / self.requests, 2) if self.requests else None,
+            'sql_ms_per_request': _ms(self.sql_time / self.requests) if self.requests else None,
+            'render_ms_per_request': _ms(self.render_time / self.requests) if self.requests else None,
+        }
+
+
+class Instrumentation:
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.max_samples = 1000
+        self.slow_query_threshold = None
+        self.endpoints = {}
+        self.slow_queries = deque(maxlen=100)
+        self.counters = {}
+        self.gauges = {}
+        self.observations = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if not app.config.get('INSTRUMENTATION_ENABLED'):
+            return
+        self.max_samples = app.config.get('INSTRUMENTATION_MAX_SAMPLES', 1000)
+        self.slow_query_threshold = app.config.get('SLOW_QUERY_THRESHOLD')
+        self.slow_queries = deque(maxlen=app.config.get('SLOW_QUERY_LOG_SIZE', 100))
+        app.extensions['instrumentation'] = self
+
+        app.before_request(_start_request)
+        app.after_request(_record_status)
+        app.teardown_request(_end_request)
+        before_render_template.connect(_start_render, app)
+        template_rendered.connect(_end_render, app)
+        if not event.contains(Engine, 'before_cursor_execute', _start_query):
+            event.listen(Engine, 'before_cursor_execute', _start_query)
+            event.listen(Engine, 'after_cursor_execute', _end_query)
+
+        if app.config.get('INSTRUMENTATION_STATS_ENDPOINT'):
+            app.register_blueprint(stats_blueprint)
+        if app.config.get('INSTRUMENTATION_DUMP_PATH'):
+            atexit.register(self.dump, app.config['INSTRUMENTATION_DUMP_PATH'])
+
+    def record_request(self, endpoint, latency, status_code, sql_count, sql_time, render_time):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats(self.max_samples)
+            stats.record(latency, status_code, sql_count, sql_time, render_time)
+
+    def record_query(self, endpoint, statement, duration):
+        if self.slow_query_threshold is not None and duration >= self.slow_query_threshold:
+            with self.lock:
+                self.slow_queries.append({
+                    'endpoint': endpoint,
+                    'duration_ms': _ms(duration),
+                    'statement': statement,
+                    'time': time.time(),
+                })
+
+    # Generic metrics that other modules can record (cache hits, queue sizes, wait times...)
+    def incr(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self.lock:
+            samples = self.observations.get(name)
+            if samples is None:
+                samples = self.observations[name] = deque(maxlen=self.max_samples)
+            samples.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'endpoints': {endpoint: stats.to_dict() for endpoint, stats in sorted(self.endpoints.items())},
+                'slow_queries': list(self.slow_queries),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'observations': {name: dict(count=len(samples), **_summary(samples))
+                                 for name, samples in sorted(self.observations.items())},
+            }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.slow_queries.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.observations.clear()
+
+
+def _start_request():
+    g.instr_start = time.perf_counter()
+    g.instr_sql_count = 0
+    g.instr_sql_time = 0.0
+    g.instr_render_time = 0.0
+
+
+def _record_status(response):
+    # keep the status code for the teardown, where the response is not available
+    g.instr_status = response.status_code
+    return response
+
+
+def _end_request(error=None):
+    if 'instr_start' not in g:
+        return
+    latency = time.perf_counter() - g.instr_start
+    status_code = 500 if error is not None else g.get('instr_status', 200)
+    current_app.extensions['instrumentation'].record_request(
+        request.endpoint or 'unknown', latency, status_code,
+        g.instr_sql_count, g.instr_sql_time, g.instr_render_time)
+
+
+def _start_render(app, template, context, **extra):
+    g.instr_render_start = time.perf_counter()
+
+
+def _end_render(app, template, context, **extra):
+    if 'instr_render_start' in g and 'instr_render_time' in g:
+        g.instr_render_time += time.perf_counter() - g.pop('instr_render_start')
+
+
+# The start time is kept on the execution context of the statement, which is discarded with it even if the
+# statement fails (after_cursor_execute is then not called)
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._instr_query_start = time.perf_counter()
+
+
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_instr_query_start', None)
+    if start is None:
+        return
+    duration = time.perf_counter() - start
+    if has_request_context() and 'instr_sql_count' in g:
+        g.instr_sql_count += 1
+        g.instr_sql_time += duration
+        current_app.extensions['instrumentation'].record_query(request.endpoint, statement, duration)
+
+
+# Opt-in endpoint exposing the aggregates as JSON
+# The statements of the slow query log can contain private data, so the endpoint only answers the requests from
+# the machine itself (INSTRUMENTATION_STATS_ADDRESSES) and the users listed in INSTRUMENTATION_STATS_ADMINS.
+stats_blueprint = Blueprint('stats', __name__)
+
+
+@stats_blueprint.route('/_stats')
+def stats_handler():
+    if not stats_allowed():
+        abort(403)
+    return jsonify(current_app.extensions['instrumentation'].snapshot())
+
+
+# A request through a reverse proxy on the same machine also comes from 127.0.0.1, but with a Forwarded header
+def stats_allowed():
+    if (request.remote_addr in current_app.config.get('INSTRUMENTATION_STATS_ADDRESSES', ('127.0.0.1', '::1'))
+            and 'X-Forwarded-For' not in request.headers and 'Forwarded' not in request.headers):
+        return True
+    return current_user.is_authenticated and \
+        current_user.email in current_app.config.get('INSTRUMENTATION_STATS_ADMINS', ())
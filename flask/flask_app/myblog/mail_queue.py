@@ -0,0 +1,211 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+
+logger = logging.getLogger(__name__)
+
+
+# Background queue for the outgoing emails
+#
+# Sending an email means connecting to the SMTP server, negotiating TLS and authenticating, which can take
+# seconds with a slow mail server. Instead of doing it in the request, the routes put the message in a queue
+# and return immediately, and background worker threads deliver the queued messages.
+#
+# The workers send the messages by batches (up to MAIL_QUEUE_BATCH_SIZE) over a single SMTP connection.
+# If the delivery fails, the batch is retried with an exponential backoff (MAIL_QUEUE_RETRIES times), and each
+# SMTP operation is limited by MAIL_QUEUE_TIMEOUT.
+# The queue is in memory, so the messages still in the queue are lost if the process is stopped.
+#
+# When MAIL_QUEUE_ENABLED is not set (or when MAIL_SUPPRESS_SEND is set in tests), the messages are sent
+# synchronously with Flask-Mail as before.
+#
+# Flask-Mail (and smtplib, the email package, ssl...) are only imported when the first message is sent, most
+# processes never send any email and do not need to pay for these imports on startup.
+
+
+# Replacement of the Flask-Mail extension object, importing Flask-Mail on first use
+# The state created by Flask-Mail is stored in app.extensions['mail'] like with Mail.init_app().
+class LazyMail:
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['mail'] = self
+
+    def state(self):
+        app = current_app._get_current_object()
+        with self.lock:
+            if app.extensions['mail'] is self:
+                from flask_mail import Mail
+                app.extensions['mail'] = Mail().init_mail(app.config, app.debug, app.testing)
+            return app.extensions['mail']
+
+    def send(self, msg):
+        self.state().send(msg)
+
+    # Flask-Mail reads its settings from app.extensions['mail'] (like Message.as_bytes() reading
+    # ascii_attachments), they are read from the real state
+    def __getattr__(self, name):
+        return getattr(self.state(), name)
+
+
+class MailQueue:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.queue = None
+        self.workers = []
+        self.workers_pid = None
+        self.lock = threading.Lock()
+        self.instrumentation = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('MAIL_QUEUE_ENABLED', False) and not config.get('MAIL_SUPPRESS_SEND', app.testing)
+        self.server = config['MAIL_SERVER']
+        self.port = config['MAIL_PORT']
+        self.use_tls = config.get('MAIL_USE_TLS', False)
+        self.use_ssl = config.get('MAIL_USE_SSL', False)
+        self.username = config.get('MAIL_USERNAME')
+        self.password = config.get('MAIL_PASSWORD')
+        self.worker_count = config.get('MAIL_QUEUE_WORKERS', 1)
+        self.batch_size = config.get('MAIL_QUEUE_BATCH_SIZE', 20)
+        self.retries = config.get('MAIL_QUEUE_RETRIES', 3)
+        self.backoff = config.get('MAIL_QUEUE_BACKOFF', 1.0)
+        self.timeout = config.get('MAIL_QUEUE_TIMEOUT', 10)
+        self.queue = queue.Queue(maxsize=config.get('MAIL_QUEUE_MAX_SIZE', 1000))
+        self.instrumentation = app.extensions.get('instrumentation')
+        app.extensions['mail_queue'] = self
+
+    # Send a Flask-Mail message, from a route (it requires the app context)
+    def send(self, msg):
+        from flask_mail import sanitize_address
+
+        if not self.enabled:
+            current_app.extensions['mail'].send(msg)
+            return
+
+        # the message is serialized now, so the workers do not need the app context
+        envelope = (sanitize_address(msg.sender), [sanitize_address(r) for r in msg.send_to], msg.as_bytes())
+        self._start_workers()
+        try:
+            self.queue.put_nowait((envelope, time.perf_counter()))
+        except queue.Full:
+            logger.error('Mail queue full, dropping message to %s', envelope[1])
+            self._incr('mail.dropped')
+        self._gauge('mail.queue_length', self.queue.qsize())
+
+    # Wait until all the queued messages are processed (for tests and graceful shutdowns)
+    # With a timeout, return False if there are still messages after timeout seconds (a delivery can be waiting for
+    # its retry backoff or for the SMTP server), so a stopping process does not wait longer than it is allowed to.
+    def flush(self, timeout=None):
+        if self.queue is None:
+            return True
+        if timeout is None:
+            self.queue.join()
+            return True
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logger.warning('Mail queue not flushed after %ss, %d messages not sent',
+                                   timeout, self.queue.unfinished_tasks)
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def _start_workers(self):
+        # the threads are started on first use, and again in processes forked after that
+        with self.lock:
+            if self.workers_pid == os.getpid():
+                return
+            self.workers = [threading.Thread(target=self._work, name=f'mail-queue-{i}', daemon=True)
+                            for i in range(self.worker_count)]
+            for worker in self.workers:
+                worker.start()
+            self.workers_pid = os.getpid()
+
+    def _work(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._deliver(batch)
+            except Exception:
+                logger.exception('Unexpected error in the mail queue worker')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                self._gauge('mail.queue_length', self.queue.qsize())
+
+    def _deliver(self, batch):
+        import smtplib
+
+        pending = list(batch)
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                with self._connect() as conn:
+                    while pending:
+                        (sender, recipients, body), enqueued = pending[0]
+                        try:
+                            conn.sendmail(sender, recipients, body)
+                            self._observe('mail.send', time.perf_counter() - enqueued)
+                            self._incr('mail.sent')
+                        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused) as e:
+                            # permanent error for this message only, no need to retry it
+                            logger.error('Mail to %s refused : %s', recipients, e)
+                            self._incr('mail.failed')
+                        pending.pop(0)
+                return
+            except (smtplib.SMTPException, OSError) as e:
+                logger.warning('Mail delivery failed (attempt %d/%d) : %s', attempt + 1, self.retries + 1, e)
+                self._incr('mail.retries')
+        logger.error('Giving up delivery of %d messages', len(pending))
+        self._incr('mail.failed', len(pending))
+
+    def _connect(self):
+        import smtplib
+
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.server, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                conn.starttls()
+            if self.username and self.password:
+                conn.login(self.username, self.password)
+        except Exception:
+            # the connection is not returned to the caller, so it must be closed here
+            conn.close()
+            raise
+        return conn
+
+    def _incr(self, name, value=1):
+        if self.instrumentation:
+            self.instrumentation.incr(name, value)
+
+    def _gauge(self, name, value):
+        if self.instrumentation:
+            self.instrumentation.gauge(name, value)
+
+    def _observe(self, name, seconds):
+        if self.instrumentation:
+            self.instrumentation.observe(name, seconds)
@@ -1,18 +1,21 @@
+import secrets
 from datetime import datetime
 from flask import current_app
 from flask_login import UserMixin
 from itsdangerous.url_safe import URLSafeTimedSerializer
+from sqlalchemy import DDL, event
 
-from myblog import db, login_manager
+from myblog import db, login_manager, user_cache
 
 
 # For the login manager to be able to manage the session, it needs :
 #  - the below function with decorator to know how to get a user in DB
 #  - the DB user model to have some specific fields (is_active, is_authenticated...)
 #    these can be done by extending the UserMixin class
+# The users are read through a short-lived cache to avoid a query on every request
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(User, int(user_id))
 
 
 # Create the model for the blog posts table in the DB
@@ -26,6 +29,13 @@ class BlogPost(db.Model):
     # Field defined as foreign key
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Composite indexes used by the posts listing, sorted by creation date (and ID to break ties)
+    # They let the DB read a page of posts directly from the index, for all posts or for a single user
+    __table_args__ = (
+        db.Index('ix_blog_post_created_on_id', 'created_on', 'id'),
+        db.Index('ix_blog_post_user_id_created_on_id', 'user_id', 'created_on', 'id'),
+    )
+
     def __repr__(self):
         return f'BlogPost({self.id}, {self.title}, {self.content}, {self.user_id}, {self.created_on})'
 
@@ -37,6 +47,9 @@ class User(db.Model, UserMixin):
     image_file = db.Column(db.String(20), nullable=False, default='default.jpg')
     password_hash = db.Column(db.String(60), nullable=False)
 
+    # number of posts of the user, maintained by the routes creating and deleting posts (see posts/counters.py)
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # 1-to-many relationship : define a relationship in the parent and a foreign key in the child
     # calling user.posts will actually run a query to fetch the posts
     # calling post.author will get the User object associated to the foreign key
@@ -60,3 +73,29 @@ class User(db.Model, UserMixin):
         except Exception as e:
             return None
         return User.query.get(user_id)
+
+
+# Counters maintained by the webapp, to avoid counting rows on every request (see posts/counters.py)
+# They also hold the content versions of the posts listings, with the date of their last change.
+class Counter(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_on = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'Counter({self.name}, {self.value})'
+
+
+# the posts counter starts at 0 when the tables are created
+event.listen(Counter.__table__, 'after_create', DDL("INSERT INTO counter (name, value) VALUES ('posts', 0)"))
+
+
+# Random identifier of the DB (row "created"), with its creation date
+# The versions of the listings restart at 0 when the DB is recreated, so their ETags also contain this identifier.
+def db_identifier_row():
+    return {'name': 'created', 'value': secrets.randbelow(2 ** 31), 'updated_on': datetime.utcnow()}
+
+
+@event.listens_for(Counter.__table__, 'after_create')
+def insert_db_identifier(target, connection, **kw):
+    connection.execute(target.insert().values(**db_identifier_row()))
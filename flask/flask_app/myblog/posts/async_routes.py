@@ -0,0 +1,101 @@
+from flask import current_app, request, render_template, abort
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from werkzeug.http import is_resource_modified
+
+from myblog import async_db, page_cache
+from myblog.aio import async_read_view
+from myblog.models import BlogPost, User
+from myblog.posts.counters import posts_version_statement, total_posts_statement, version_from_rows
+from myblog.posts.pagination import keyset_query, keyset_page, page_query, page_with_total, InvalidCursor
+from myblog.posts.routes import conditional_get_enabled, validators_from_version, with_validators
+from myblog.posts.search import SearchPage, search_statement, search_page, is_missing_index
+from myblog.posts.utils import posts_listing_statement
+
+
+# Async versions of the read handlers of routes.py, used instead of them in the async serving mode (see aio.py)
+# They answer exactly like the sync handlers, but their queries run on the async engine.
+
+
+# Async version of get_posts_handler()
+@async_read_view
+async def get_posts_async_handler():
+    # optional parameters
+    user_id = request.args.get('user', -1, type=int)
+    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    per_page = current_app.config['POSTS_PER_PAGE']
+
+    async with async_db.session() as session:
+        # conditional GET : answer 304 if the listing did not change since the version the client already has
+        validators = ()
+        if conditional_get_enabled():
+            version_user_id = None if user_id == -1 else user_id
+            rows = await session.execute(posts_version_statement(version_user_id))
+            validators = validators_from_version(*version_from_rows(rows, version_user_id))
+            if not is_resource_modified(request.environ, validators[0], last_modified=validators[1]):
+                return with_validators(current_app.response_class(status=304), *validators)
+
+        # return the page from the cache if it was already rendered
+        cache_key = page_cache.listing_key(user_id, page, cursor)
+        if cache_key is not None:
+            html = page_cache.get(cache_key)
+            if html is not None:
+                return with_validators(current_app.make_response(html), *validators)
+
+        if user_id != -1:
+            user = await session.get(User, user_id)
+            if user is None:
+                abort(404)
+            statement = posts_listing_statement().where(BlogPost.user_id == user_id)
+            total = user.post_count
+        else:
+            user = None
+            statement = posts_listing_statement()
+            total = (await session.execute(total_posts_statement())).scalar()
+            if total is None:
+                total = (await session.execute(select(func.count(BlogPost.id)))).scalar()
+
+        if cursor is not None or current_app.config['POSTS_PAGINATION'] == 'keyset':
+            try:
+                statement, direction, key = keyset_query(statement, per_page, cursor)
+            except InvalidCursor:
+                abort(400)
+            posts = keyset_page((await session.execute(statement)).scalars().all(), per_page, direction, key)
+            posts.total = total
+        else:
+            statement = page_query(statement.order_by(BlogPost.created_on.desc(), BlogPost.id.desc()),
+                                   page, per_page)
+            posts = page_with_total((await session.execute(statement)).scalars().all(), page, per_page, total)
+
+    html = render_template('posts.html', title="Posts", posts=posts, user=user)
+    if cache_key is not None:
+        page_cache.set(cache_key, html)
+    return with_validators(current_app.make_response(html), *validators)
+
+
+# Async version of search_posts_handler()
+@async_read_view
+async def search_posts_async_handler():
+    terms = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = current_app.config['POSTS_PER_PAGE']
+
+    statement = search_statement(async_db.engine.dialect.name, terms, page, per_page)
+    if statement is None:
+        posts = SearchPage([], page, False)
+    else:
+        async with async_db.session() as session:
+            try:
+                ids = [row[0] for row in await session.execute(*statement)]
+            except OperationalError as e:
+                if not is_missing_index(e):
+                    raise
+                await session.rollback()
+                ids = [row[0] for row in await session.execute(*search_statement(None, terms, page, per_page))]
+            items = []
+            if ids:
+                items = (await session.execute(posts_listing_statement().where(BlogPost.id.in_(ids[:per_page])))) \
+                    .scalars().all()
+        posts = search_page(ids, items, page, per_page)
+    return render_template('search.html', title="Search", posts=posts, terms=terms)
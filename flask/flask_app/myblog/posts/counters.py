@@ -0,0 +1,143 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from myblog import db
+from myblog.models import BlogPost, Counter, User, db_identifier_row
+
+
+logger = logging.getLogger(__name__)
+
+
+# Maintained post counters
+#
+# The listing displays the total number of posts (or of the posts of a user) and a link to every page, which
+# would need a SELECT count(*) on every page view. Instead we keep the counts up to date when posts are created
+# or deleted : the global count in the "posts" row of the counter table, and the count of each user in
+# User.post_count. The updates are done in the same transaction as the creation or deletion of the post.
+#
+# If the counters are ever wrong, they can be recomputed with :    flask posts recount
+# A DB created before the counters is upgraded when the app is created (see upgrade_counters).
+#
+# The counter table also holds a content version for the listing of all the posts (row "posts_version") and for
+# the listing of each user (rows "posts_version:user:<id>"). They are incremented by any change visible in these
+# listings, and used to answer the conditional GET requests of the listing without querying the posts.
+
+
+# Add delta to the post counters, in the current transaction (the caller commits)
+# The updates are done in SQL (value = value + delta), so concurrent requests do not overwrite each other.
+def update_post_counters(user_id, delta):
+    db.session.execute(update(User.__table__)
+                       .where(User.__table__.c.id == user_id)
+                       .values(post_count=User.__table__.c.post_count + delta))
+    db.session.execute(update(Counter.__table__)
+                       .where(Counter.__table__.c.name == 'posts')
+                       .values(value=Counter.__table__.c.value + delta))
+
+
+# Total number of posts, with a count query only if the counter was never initialized
+def total_posts():
+    counter = db.session.execute(total_posts_statement()).scalar()
+    if counter is None:
+        return BlogPost.query.count()
+    return counter
+
+
+def total_posts_statement():
+    return select(Counter.value).where(Counter.name == 'posts')
+
+
+# Recompute all the counters from the posts table
+# bind can be the session or a connection (used by the bulk loader)
+def recount_posts(bind):
+    posts, users = BlogPost.__table__, User.__table__
+    bind.execute(update(users).values(post_count=select(func.count(posts.c.id))
+                                      .where(posts.c.user_id == users.c.id)
+                                      .scalar_subquery()))
+    total = bind.execute(select(func.count(posts.c.id))).scalar()
+    bind.execute(Counter.__table__.delete().where(Counter.__table__.c.name == 'posts'))
+    bind.execute(Counter.__table__.insert().values(name='posts', value=total))
+    return total
+
+
+# Add the columns and rows of the counters to the tables of a DB created before they existed
+# Return True if the post_count column was added (its values must then be computed with recount_posts)
+def add_counter_columns():
+    inspector = inspect(db.engine)
+    added = 'post_count' not in [column['name'] for column in inspector.get_columns('user')]
+    if added:
+        db.session.execute(text('ALTER TABLE "user" ADD COLUMN post_count INTEGER NOT NULL DEFAULT 0'))
+    if 'updated_on' not in [column['name'] for column in inspector.get_columns('counter')]:
+        db.session.execute(text('ALTER TABLE counter ADD COLUMN updated_on TIMESTAMP'))
+    if db.session.execute(select(Counter.name).where(Counter.name == 'created')).first() is None:
+        db.session.execute(Counter.__table__.insert().values(**db_identifier_row()))
+    return added
+
+
+# Upgrade a DB created before the counters, when the app is created (DB_AUTO_UPGRADE) : the User model has the
+# post_count column, so without it every query loading a user would fail
+# Nothing is done on an up-to-date DB, or on a DB without tables (created later by db_create.py).
+def upgrade_counters():
+    inspector = inspect(db.engine)
+    if not inspector.has_table('user'):
+        return
+    try:
+        created = not inspector.has_table('counter')
+        if created:
+            Counter.__table__.create(db.engine)
+        if add_counter_columns() or created:
+            total = recount_posts(db.session)
+            logger.warning('Post counters added to the DB (%d posts)', total)
+        db.session.commit()
+    except (OperationalError, ProgrammingError) as e:
+        # another process is upgrading the DB at the same time
+        db.session.rollback()
+        logger.warning('Post counters upgrade failed : %s', e)
+
+
+def version_name(user_id=None):
+    return 'posts_version' if user_id is None else f'posts_version:user:{user_id}'
+
+
+# Content version of the listing of all the posts, or of the posts of a user : (version, date of the last change,
+# identifier of the DB), the identifier is 0 for a DB created before it existed (see models.py)
+def posts_version(user_id=None):
+    return version_from_rows(db.session.execute(posts_version_statement(user_id)), user_id)
+
+
+def posts_version_statement(user_id=None):
+    return select(Counter.name, Counter.value, Counter.updated_on) \
+        .where(Counter.name.in_((version_name(user_id), 'created')))
+
+
+def version_from_rows(rows, user_id=None):
+    rows = {row.name: row for row in rows}
+    row = rows.get(version_name(user_id))
+    version, updated_on = (row.value, row.updated_on) if row else (0, None)
+    created = rows.get('created')
+    return version, updated_on, created.value if created else 0
+
+
+# Increment the versions of the listing of all the posts and of the posts of a user, in the current transaction
+# The row of a user is created the first time, ignoring the conflict if a concurrent request just created it.
+def touch_posts(user_id):
+    table = Counter.__table__
+    now = datetime.utcnow()
+    for name in (version_name(), version_name(user_id)):
+        statement = update(table).where(table.c.name == name).values(value=table.c.value + 1, updated_on=now)
+        if db.session.execute(statement).rowcount == 0:
+            db.session.execute(insert_missing(table).values(name=name, value=0, updated_on=now))
+            db.session.execute(statement)
+
+
+# The counters are only written on the primary, so the dialect is the one of the primary engine
+def insert_missing(table):
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return sqlite.insert(table).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return table.insert()
@@ -0,0 +1,127 @@
+import base64
+import json
+from datetime import datetime
+
+from flask import abort
+from flask_sqlalchemy import Pagination
+from sqlalchemy import and_, or_
+
+from myblog.models import BlogPost
+
+
+# Keyset (or "cursor") pagination for the posts listing.
+#
+# The paginate() method of Flask-SQLAlchemy uses LIMIT/OFFSET : to display page N the DB still has to walk
+# through all the rows of the previous pages, and it runs an extra count(*) query on every call.
+# With keyset pagination, we remember the sort key (created_on, id) of the last post of the page, and the next
+# page is simply "the posts older than this key", which the DB answers with an index seek whatever the page.
+#
+# The key is sent to the browser as an opaque token (the cursor) in the "cursor" URL parameter.
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# A cursor contains the direction to move to and the sort key of the post to start from
+#   'n' (next) : posts strictly older than the key
+#   'p' (prev) : posts strictly newer than the key
+def encode_cursor(direction, post):
+    payload = json.dumps([direction, post.created_on.isoformat(), post.id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        direction, created_on, post_id = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        if direction not in ('n', 'p'):
+            raise ValueError(f'unknown direction {direction}')
+        return direction, datetime.fromisoformat(created_on), int(post_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f'Invalid pagination cursor : {cursor}') from e
+
+
+# Page of posts returned by the keyset pagination
+# It exposes the same "items" field as the Flask-SQLAlchemy Pagination object so the template can use both.
+# There is no total and no page number, since computing them is exactly what we want to avoid.
+class KeysetPage:
+    keyset = True
+
+    def __init__(self, items, next_cursor, prev_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+# Fetch one page of posts from a query ordered by (created_on, id) descending
+# The query must not be ordered yet, the ordering depends on the direction of the cursor.
+# We fetch one extra post to know if there is another page after this one without counting.
+def keyset_paginate(query, per_page, cursor=None):
+    query, direction, key = keyset_query(query, per_page, cursor)
+    return keyset_page(query.all(), per_page, direction, key)
+
+
+# Filter, order and limit a query (or a select() statement) to fetch the posts of the page of a cursor
+def keyset_query(query, per_page, cursor=None):
+    if cursor is None:
+        direction, key = 'n', None
+    else:
+        direction, created_on, post_id = decode_cursor(cursor)
+        key = (created_on, post_id)
+
+    if direction == 'n':
+        if key is not None:
+            query = query.filter(or_(BlogPost.created_on < key[0],
+                                     and_(BlogPost.created_on == key[0], BlogPost.id < key[1])))
+        query = query.order_by(BlogPost.created_on.desc(), BlogPost.id.desc())
+    else:
+        query = query.filter(or_(BlogPost.created_on > key[0],
+                                 and_(BlogPost.created_on == key[0], BlogPost.id > key[1])))
+        query = query.order_by(BlogPost.created_on.asc(), BlogPost.id.asc())
+    return query.limit(per_page + 1), direction, key
+
+
+# Build the page from the posts fetched by the query of keyset_query()
+def keyset_page(items, per_page, direction, key):
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if direction == 'n':
+        # going forward : there is a previous page only if we came from a cursor
+        has_next, has_prev = has_more, key is not None
+    else:
+        # going backward : the items were fetched in ascending order, and there is always a next page
+        items.reverse()
+        has_next, has_prev = True, has_more
+
+    next_cursor = encode_cursor('n', items[-1]) if items and has_next else None
+    prev_cursor = encode_cursor('p', items[0]) if items and has_prev else None
+    return KeysetPage(items, next_cursor, prev_cursor)
+
+
+# Page number pagination like query.paginate(), but with a known total instead of a count(*) query
+def paginate_with_total(query, page, per_page, total):
+    return page_with_total(page_query(query, page, per_page).all(), page, per_page, total, query)
+
+
+# Limit an ordered query (or a select() statement) to the posts of a page number
+def page_query(query, page, per_page):
+    if page < 1:
+        abort(404)
+    return query.limit(per_page).offset((page - 1) * per_page)
+
+
+def page_with_total(items, page, per_page, total, query=None):
+    if not items and page != 1:
+        abort(404)
+    return Pagination(query, page, per_page, total, items)
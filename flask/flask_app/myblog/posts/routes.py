@@ -1,11 +1,19 @@
-from flask import request, render_template, redirect, flash, url_for, abort, Blueprint
+from datetime import datetime, timezone
+
+from flask import current_app, request, session, render_template, redirect, flash, url_for, abort, Blueprint
 from flask_login import current_user, login_required
+from werkzeug.http import is_resource_modified
 
 # import "db" and "app" defined in the __init__.py, and other modules from the package
 # Note : for some reason the import of myblog package is flagged as an error in Pycharm
-from myblog import db
+from myblog import db, page_cache
 from myblog.models import BlogPost, User
 from myblog.posts.forms import PostForm
+from myblog.posts.counters import update_post_counters, total_posts, recount_posts, add_counter_columns, \
+    posts_version, touch_posts
+from myblog.posts.pagination import keyset_paginate, paginate_with_total, InvalidCursor
+from myblog.posts.search import search_posts, rebuild_search_index
+from myblog.posts.utils import posts_listing_query
 
 
 # The name "posts" used for the blueprint is the prefix to use in all calls of url_for()
@@ -18,20 +26,128 @@ def get_posts_handler():
     # optional parameters
     user_id = request.args.get('user', -1, type=int)
     page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    per_page = current_app.config['POSTS_PER_PAGE']
+
+    # conditional GET : if the listing did not change since the version the client already has, answer 304
+    # without querying the posts nor rendering the page
+    validators = listing_validators(user_id) or ()
+    if validators and not is_resource_modified(request.environ, validators[0], last_modified=validators[1]):
+        return with_validators(current_app.response_class(status=304), *validators)
+
+    # return the page from the cache if it was already rendered
+    cache_key = page_cache.listing_key(user_id, page, cursor)
+    if cache_key is not None:
+        html = page_cache.get(cache_key)
+        if html is not None:
+            return with_validators(current_app.make_response(html), *validators)
+
     if user_id != -1:
-        # return all posts from the specified user paginated by pages of 3 posts
+        # return all posts from the specified user
         user = User.query.get_or_404(user_id)
-        posts = BlogPost.query \
-            .filter_by(user_id=user_id) \
-            .order_by(BlogPost.created_on.desc()) \
-            .paginate(per_page=3, page=page)
+        query = posts_listing_query().filter_by(user_id=user_id)
+        total = user.post_count
     else:
-        # return all the posts from the DB paginated by pages of 3 posts
+        # return all the posts from the DB
         user = None
-        posts = BlogPost.query \
-            .order_by(BlogPost.created_on.desc()) \
-            .paginate(per_page=3, page=page)
-    return render_template('posts.html', title="Posts", posts=posts, user=user)
+        query = posts_listing_query()
+        total = total_posts()
+
+    if cursor is not None or current_app.config['POSTS_PAGINATION'] == 'keyset':
+        # keyset pagination with next/prev links, the cost does not depend on how deep the page is
+        try:
+            posts = keyset_paginate(query, per_page, cursor)
+        except InvalidCursor:
+            abort(400)
+        posts.total = total
+    else:
+        # page number pagination, with a link to every page (using the maintained counters instead of a count)
+        posts = paginate_with_total(query.order_by(BlogPost.created_on.desc(), BlogPost.id.desc()),
+                                    page, per_page, total)
+    html = render_template('posts.html', title="Posts", posts=posts, user=user)
+    if cache_key is not None:
+        page_cache.set(cache_key, html)
+    return with_validators(current_app.make_response(html), *validators)
+
+
+# Validators (ETag, Last-Modified) of a posts listing, from its content version (see counters.py)
+# The page also depends on the logged user (edit buttons, navigation bar), so the ETag contains its id, and the
+# date alone is only used for anonymous visitors (like feed readers).
+# The versions restart at 0 when the DB is recreated, so the ETag also contains the identifier of the DB, and the
+# page changes with the templates, so it contains the build identifier too (see templating.py).
+# None if the page must not be answered with a 304 : when it is disabled, or if there are flash messages to display.
+def listing_validators(user_id):
+    if not conditional_get_enabled():
+        return None
+    return validators_from_version(*posts_version(None if user_id == -1 else user_id))
+
+
+def conditional_get_enabled():
+    return current_app.config['POSTS_CONDITIONAL_GET'] and not session.get('_flashes')
+
+
+def validators_from_version(version, updated_on, db_identifier):
+    viewer = current_user.id if current_user.is_authenticated else 'anon'
+    last_modified = None
+    if updated_on is not None and not current_user.is_authenticated:
+        # Last-Modified is in seconds, so another change in the same second would keep the same date : the date
+        # is only sent once its second is over, any later change then has a later date
+        # the page of a new build is modified even if the posts are not
+        last_modified = max(updated_on, current_app.config.get('BUILD_TIME') or updated_on).replace(microsecond=0)
+        if last_modified < datetime.utcnow().replace(microsecond=0):
+            last_modified = last_modified.replace(tzinfo=timezone.utc)
+        else:
+            last_modified = None
+    return f"posts-{current_app.config.get('BUILD_ID')}-{db_identifier}-{version}-{viewer}", last_modified
+
+
+def with_validators(response, etag=None, last_modified=None):
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.last_modified = last_modified
+        response.vary.add('Cookie')
+        # browsers may keep the page, but must check it is still valid before displaying it again
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+# Handler for a full-text search on the title and content of the posts, with the best matches first
+@posts_blueprint.route('/posts/search', methods=['GET'])
+def search_posts_handler():
+    terms = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+    posts = search_posts(terms, page, current_app.config['POSTS_PER_PAGE'])
+    return render_template('search.html', title="Search", posts=posts, terms=terms)
+
+
+# In the async serving mode, the read handlers are replaced by their async versions (see aio.py)
+# This runs when the blueprint is registered, after its routes are added to the app.
+@posts_blueprint.record_once
+def use_async_handlers(state):
+    if state.app.config.get('ASYNC_READS'):
+        from myblog.posts.async_routes import get_posts_async_handler, search_posts_async_handler
+        state.app.view_functions['posts.get_posts_handler'] = get_posts_async_handler
+        state.app.view_functions['posts.search_posts_handler'] = search_posts_async_handler
+
+
+# Command to create or rebuild the full-text index of an existing DB :    flask posts search-rebuild
+@posts_blueprint.cli.command('search-rebuild')
+def search_rebuild_command():
+    if rebuild_search_index():
+        print('Full-text search index rebuilt')
+    else:
+        print(f'No full-text index for {db.engine.dialect.name} databases, the search uses LIKE queries')
+
+
+# Command to recompute the post counters from the posts table :    flask posts recount
+@posts_blueprint.cli.command('recount')
+def recount_command():
+    db.create_all()  # create the counter table if missing
+    add_counter_columns()
+    total = recount_posts(db.session)
+    db.session.commit()
+    print(f'Post counters recomputed ({total} posts)')
 
 
 # Handler to delete a blog post
@@ -41,8 +157,12 @@ def delete_post_handler(post_id):
     post = BlogPost.query.get_or_404(post_id)
     if post.author != current_user:  # we can also use: post.user_id != current_user.id
         abort(403)
+    author_id = post.user_id
     db.session.delete(post)
+    update_post_counters(author_id, -1)
+    touch_posts(author_id)
     db.session.commit()
+    page_cache.invalidate_posts(author_id)
     flash('Your post has been deleted.', 'success')
     return redirect(url_for('posts.get_posts_handler'))
 
@@ -57,7 +177,10 @@ def create_post_handler():
         # Add a post in the DB on POST (from the form submit button click)
         new_post = BlogPost(title=form.title.data, content=form.content.data, user_id=current_user.id)
         db.session.add(new_post)
+        update_post_counters(current_user.id, 1)
+        touch_posts(current_user.id)
         db.session.commit()
+        page_cache.invalidate_posts(current_user.id)
         flash('Your post was successfully created.', 'success')
         return redirect('/posts')
 
@@ -77,7 +200,9 @@ def edit_post_handler(post_id):
     if form.validate_on_submit():
         post.title = form.title.data
         post.content = form.content.data
+        touch_posts(post.user_id)
         db.session.commit()
+        page_cache.invalidate_posts(post.user_id)
         flash('Your post has been updated!', 'success')
         return redirect('/posts')
     if request.method == 'GET':
@@ -0,0 +1,164 @@
+import logging
+import re
+
+from sqlalchemy import DDL, and_, event, func, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from myblog import db
+from myblog.models import BlogPost
+from myblog.posts.utils import posts_listing_query
+
+
+logger = logging.getLogger(__name__)
+
+
+# Full-text search on the title and content of the posts
+#
+# A LIKE '%term%' query must read the content of every post, so we use the full-text index of the DB instead :
+#  - SQLite : an FTS5 virtual table indexing the blog_post table, kept up to date by triggers on insert,
+#             update and delete, and ranked with bm25 (matches in the title weigh more than in the content)
+#  - PostgreSQL : a GIN index on the tsvector of the title and content, ranked with ts_rank
+#
+# The index is created with the tables (db.create_all), for an existing DB it can be created or rebuilt with :
+#     flask posts search-rebuild
+#
+# Without a full-text index (other DBs like MySQL, or an existing SQLite DB where the index was not created yet),
+# the search falls back to LIKE queries, with the most recent posts first. They scan the posts table, so they are
+# only acceptable for small tables.
+
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_fts USING fts5("
+    "title, content, content='blog_post', content_rowid='id', tokenize='porter unicode61')",
+
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_insert AFTER INSERT ON blog_post BEGIN "
+    "INSERT INTO blog_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_delete AFTER DELETE ON blog_post BEGIN "
+    "INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "END",
+
+    "CREATE TRIGGER IF NOT EXISTS blog_post_fts_update AFTER UPDATE OF title, content ON blog_post BEGIN "
+    "INSERT INTO blog_post_fts(blog_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content); "
+    "INSERT INTO blog_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content); "
+    "END",
+]
+
+POSTGRESQL_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_blog_post_fts ON blog_post "
+    "USING gin (to_tsvector('english', title || ' ' || content))",
+]
+
+# create the index with the blog_post table, and drop the FTS table with it
+for statement in SQLITE_DDL:
+    event.listen(BlogPost.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRESQL_DDL:
+    event.listen(BlogPost.__table__, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+event.listen(BlogPost.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS blog_post_fts').execute_if(dialect='sqlite'))
+
+
+# Build a FTS5 query from the user input : each word is quoted, so the FTS5 operators typed by the user
+# (AND, OR, NEAR, *, column filters...) are searched as plain words
+def fts5_query(terms):
+    words = re.findall(r'\w+', terms)
+    return ' '.join(f'"{word}"' for word in words)
+
+
+# Page of search results, with previous/next links only (counting all the matches would cost more than the search)
+class SearchPage:
+
+    def __init__(self, items, page, has_next):
+        self.items = items
+        self.page = page
+        self.has_next = has_next
+        self.has_prev = page > 1
+
+
+def search_posts(terms, page, per_page):
+    # the reads go to the same DB type on the primary and the replica
+    dialect = db.engine.dialect.name
+    statement = search_statement(dialect, terms, page, per_page)
+    if statement is None:
+        return SearchPage([], page, False)
+    try:
+        ids = [row[0] for row in db.session.execute(*statement)]
+    except OperationalError as e:
+        if not is_missing_index(e):
+            raise
+        db.session.rollback()
+        ids = [row[0] for row in db.session.execute(*search_statement(None, terms, page, per_page))]
+
+    # load the posts (and their authors) in a single query, and keep the ranking order
+    posts = posts_listing_query().filter(BlogPost.id.in_(ids[:per_page])).all() if ids else []
+    return search_page(ids, posts, page, per_page)
+
+
+# Statement and parameters of the query returning the ids of the best matches (plus one to know if there is a next
+# page), or None if there is nothing to search
+# With a dialect without full-text index (or None), the statement uses LIKE instead.
+def search_statement(dialect, terms, page, per_page):
+    params = {'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if dialect == 'sqlite':
+        params['terms'] = fts5_query(terms)
+        if not params['terms']:
+            return None
+        statement = text("SELECT rowid FROM blog_post_fts WHERE blog_post_fts MATCH :terms "
+                         "ORDER BY bm25(blog_post_fts, 10.0, 1.0) LIMIT :limit OFFSET :offset")
+    elif dialect == 'postgresql':
+        params['terms'] = terms
+        statement = text("SELECT id FROM blog_post "
+                         "WHERE to_tsvector('english', title || ' ' || content) @@ plainto_tsquery('english', :terms) "
+                         "ORDER BY ts_rank(to_tsvector('english', title || ' ' || content), "
+                         "plainto_tsquery('english', :terms)) DESC LIMIT :limit OFFSET :offset")
+    else:
+        return like_search_statement(terms, page, per_page)
+    return statement, params
+
+
+# Fallback without full-text index : the posts containing all the words, in their title or content
+def like_search_statement(terms, page, per_page):
+    words = [word.lower() for word in re.findall(r'\w+', terms)]
+    if not words:
+        return None
+    title, content = func.lower(BlogPost.title), func.lower(BlogPost.content)
+    statement = select(BlogPost.id) \
+        .where(and_(*[or_(title.contains(word, autoescape=True), content.contains(word, autoescape=True))
+                      for word in words])) \
+        .order_by(BlogPost.created_on.desc(), BlogPost.id.desc()) \
+        .limit(per_page + 1).offset((page - 1) * per_page)
+    return statement, {}
+
+
+# The FTS5 table of an existing SQLite DB is missing until 'flask posts search-rebuild' is run
+def is_missing_index(error):
+    if 'blog_post_fts' not in str(error.orig):
+        return False
+    logger.warning('Full-text index missing, searching with LIKE. Create it with : flask posts search-rebuild')
+    return True
+
+
+# Page of the posts of the matching ids, in the ranking order
+def search_page(ids, posts, page, per_page):
+    has_next = len(ids) > per_page
+    posts = {post.id: post for post in posts}
+    return SearchPage([posts[post_id] for post_id in ids[:per_page] if post_id in posts], page, has_next)
+
+
+# Create the full-text index if it does not exist, and re-index all the existing posts
+# Return False if the DB has no full-text index (the search then uses LIKE)
+def rebuild_search_index():
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text("INSERT INTO blog_post_fts(blog_post_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRESQL_DDL:
+            db.session.execute(text(statement))
+        db.session.execute(text('REINDEX INDEX ix_blog_post_fts'))
+    else:
+        return False
+    db.session.commit()
+    return True
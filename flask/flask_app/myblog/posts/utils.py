@@ -0,0 +1,17 @@
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from myblog.models import BlogPost
+
+
+# Base query for all the endpoints listing posts
+# The posts.html template reads the author of every post (username, picture...), and the "author" relationship
+# is lazy, so without this option each post would run its own SELECT on the user table (N+1 queries).
+# The joinedload() option fetches the authors in the same query as the posts with a JOIN.
+def posts_listing_query():
+    return BlogPost.query.options(joinedload(BlogPost.author))
+
+
+# Same as posts_listing_query() as a select() statement, for the async session (see posts/async_routes.py)
+def posts_listing_statement():
+    return select(BlogPost).options(joinedload(BlogPost.author))
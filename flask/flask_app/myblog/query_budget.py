@@ -0,0 +1,55 @@
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Guard against routes running too many SQL queries (typically N+1 queries on relationships)
+#
+# When the QUERY_BUDGET config is set, every SQL statement run during a request is counted, and the request
+# fails with a QueryBudgetExceeded error if the count is over the budget of its endpoint.
+# It is meant to be enabled in tests (with TESTING=True the error is propagated to the test client) :
+#     QUERY_BUDGET = 5                                         same budget for all endpoints
+#     QUERY_BUDGET = {'posts.get_posts_handler': 4, None: 10}  budget per endpoint, None for the default
+# The tests of the webapp enable it for the listings (see conftest.py and tests/test_query_budget.py).
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if app.config.get('QUERY_BUDGET') is None:
+            return
+        # the listener is on the Engine class so it sees the queries of all engines (and all apps)
+        if not event.contains(Engine, 'before_cursor_execute', _count_query):
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+        # checked at the teardown of the request, which also runs when the view raised an error (unlike after_request).
+        # The teardown functions run in reverse order : registered before the other extensions, it runs after them
+        app.teardown_request(_check_query_budget)
+        app.extensions['query_budget'] = self
+
+    @staticmethod
+    def budget_for(app, endpoint):
+        budget = app.config.get('QUERY_BUDGET')
+        if isinstance(budget, dict):
+            return budget.get(endpoint, budget.get(None))
+        return budget
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.setdefault('budget_statements', []).append(statement)
+
+
+def _check_query_budget(exc):
+    budget = QueryBudget.budget_for(current_app, request.endpoint)
+    statements = g.get('budget_statements', [])
+    if budget is not None and len(statements) > budget:
+        raise QueryBudgetExceeded(f'{request.endpoint} ran {len(statements)} SQL queries for a budget of {budget} :\n'
+                                  + '\n'.join(statements))
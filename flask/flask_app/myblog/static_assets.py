@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+from werkzeug.utils import safe_join
+
+
+# Long-lived HTTP caching of the static files
+#
+# url_for('static', filename=...) generates URLs with a fingerprint of the file content : /static/css/app.css?v=1a2b3c
+# Since the URL changes when the file changes, browsers and proxies can keep the file forever without asking
+# our workers again : requests with a fingerprint are served with "Cache-Control: immutable" and a 1-year max-age.
+# Requests without fingerprint still get the default Flask behavior (ETag and revalidation).
+#
+# If the client accepts it, a precompressed version of the file (.br or .gz next to the file) is served.
+# These versions are generated with the command :    flask assets compress
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json')
+
+
+class StaticAssets:
+
+    def __init__(self, app=None):
+        self.fingerprints = {}  # file name -> (mtime, size, fingerprint)
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.cli.add_command(assets_cli)
+        if not app.config.get('STATIC_FINGERPRINTING'):
+            return
+        self.max_age = app.config.get('STATIC_MAX_AGE', 365 * 24 * 3600)
+        app.url_defaults(self._add_fingerprint)
+        app.view_functions['static'] = self.static_handler
+        app.extensions['static_assets'] = self
+
+    # Short hash of the file content, recomputed only when the file is modified
+    def fingerprint(self, filename):
+        path = safe_join(current_app.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except (OSError, TypeError):
+            return None  # missing file (or invalid path), the URL is generated without fingerprint
+        with self.lock:
+            cached = self.fingerprints.get(filename)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        with open(path, 'rb') as f:
+            fingerprint = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self.lock:
+            self.fingerprints[filename] = (stat.st_mtime_ns, stat.st_size, fingerprint)
+        return fingerprint
+
+    def _add_fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            fingerprint = self.fingerprint(values['filename'])
+            if fingerprint:
+                values['v'] = fingerprint
+
+    # Replacement of the default handler of the "static" endpoint
+    def static_handler(self, filename):
+        app = current_app
+        response = None
+        source = safe_join(app.static_folder, filename)
+        for encoding, extension in (('br', '.br'), ('gzip', '.gz')):
+            if source is None or not request.accept_encodings[encoding]:
+                continue
+            # only use a compressed version generated after the last change of the file
+            compressed = source + extension
+            if os.path.isfile(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(source):
+                response = send_from_directory(app.static_folder, filename + extension,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        if response is None:
+            response = app.send_static_file(filename)
+        response.vary.add('Accept-Encoding')
+
+        # the fingerprint must match the current file, or an old URL would cache the new content forever
+        if request.args.get('v') and request.args['v'] == self.fingerprint(filename):
+            response.headers['Cache-Control'] = f'public, max-age={self.max_age}, immutable'
+        return response
+
+
+assets_cli = AppGroup('assets', help='Manage the static files.')
+
+
+# Write a .gz (and .br if the brotli module is installed) version of the static text files
+@assets_cli.command('compress')
+def compress_command():
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    count = 0
+    for root, _, files in os.walk(current_app.static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                content = f.read()
+            with open(path + '.gz', 'wb') as f:
+                f.write(gzip.compress(content, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    f.write(brotli.compress(content, quality=11))
+            count += 1
+    print(f'Compressed {count} static files' + ('' if brotli else ' (gzip only, brotli is not installed)'))
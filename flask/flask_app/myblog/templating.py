@@ -0,0 +1,89 @@
+import hashlib
+import os
+import time
+from datetime import datetime
+
+from flask import current_app
+from flask.cli import AppGroup
+from jinja2 import FileSystemBytecodeCache
+
+
+# Persistent cache of the compiled templates
+#
+# Jinja compiles each template to Python code the first time it is rendered by a process, which takes a few ms per
+# template (more for the templates extending base.html), so the first requests of every new worker are slow.
+# With TEMPLATE_BYTECODE_CACHE set to a folder, the compiled code is saved in this folder and the other processes
+# (and the next restarts) load it instead of compiling the templates again.
+#
+# The folder can be filled at build time (or before starting the workers) with :    flask templates precompile
+# With TEMPLATE_PRELOAD, all the templates are also loaded when the app is created, so with a server loading the
+# app before forking its workers (like gunicorn --preload) the workers start with all the templates ready.
+#
+# Jinja checks the source of the templates against the cache, a modified template is compiled again.
+#
+# The rendered pages depend on the templates and on the static files (their fingerprints are in the URLs), so the
+# ETags and the cache keys of the pages contain a build identifier : BUILD_ID if it is set (like the commit of the
+# deployed version), or a hash of the templates and static files. A deploy changing them changes the identifier,
+# and the clients and the page cache do not keep the pages of the previous version.
+
+
+class TemplateCache:
+
+    def __init__(self, app=None):
+        self.directory = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.cli.add_command(templates_cli)
+        app.extensions['template_cache'] = self
+        self.directory = app.config.get('TEMPLATE_BYTECODE_CACHE')
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            # must be set before the first use of app.jinja_env, which creates the environment with these options
+            app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(self.directory))
+        if app.config.get('TEMPLATE_PRELOAD'):
+            self.load_all(app)
+        build_id, build_time = build_info(app)
+        app.config['BUILD_ID'] = app.config.get('BUILD_ID') or build_id
+        app.config['BUILD_TIME'] = build_time
+
+    # Load (and compile if needed) all the templates of the app, they stay in the Jinja environment of the process
+    def load_all(self, app):
+        names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+        for name in names:
+            app.jinja_env.get_template(name)
+        return names
+
+
+# Hash of the templates and static files (except the uploaded profile pictures), and date of the last modified one
+def build_info(app):
+    folders = [os.path.join(app.root_path, app.template_folder), app.static_folder]
+    excluded = os.path.join(app.static_folder, 'images')
+    digest = hashlib.sha256()
+    build_time = 0
+    for folder in folders:
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = sorted(name for name in dirs if os.path.join(root, name) != excluded)
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, app.root_path).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+                build_time = max(build_time, os.path.getmtime(path))
+    return digest.hexdigest()[:12], datetime.utcfromtimestamp(int(build_time))
+
+
+templates_cli = AppGroup('templates', help='Manage the Jinja templates.')
+
+
+# Compile all the templates in the bytecode cache folder
+@templates_cli.command('precompile')
+def precompile_command():
+    template_cache = current_app.extensions['template_cache']
+    if not template_cache.directory:
+        print('TEMPLATE_BYTECODE_CACHE is not set, nothing to precompile')
+        return
+    start = time.perf_counter()
+    names = template_cache.load_all(current_app)
+    print(f'Compiled {len(names)} templates in {template_cache.directory} ({time.perf_counter() - start:.2f}s)')
@@ -0,0 +1,159 @@
+import hashlib
+import math
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import or_
+
+
+# Checks that a username and an email are not already used, for the signup and account forms
+#
+# The fields used to be checked by two separate queries, one per field. Here both are checked by a single query,
+# and in front of it there is an optional Bloom filter of all the usernames and emails already taken.
+# A Bloom filter can answer "maybe taken" for a free value (false positive, ~AVAILABILITY_FILTER_ERROR_RATE), but
+# never "free" for a value it contains : when all the values of a form are absent from the filter, they are
+# available and the DB is not queried at all, which is the common case for real signups and for bots trying
+# random usernames.
+#
+# With AVAILABILITY_FILTER_PRELOAD the filter is loaded from the DB when the app is created (if the user table
+# exists), so the first signup does not wait for a scan of the table, otherwise it is loaded on first use.
+# Each process only sees the users created by itself.
+# To pick up the users created by other processes it is reloaded every AVAILABILITY_FILTER_REFRESH seconds,
+# and in the meantime the unique constraints of the user table are still checked on commit (the routes handle
+# the IntegrityError), so the filter can never lead to a duplicate user.
+
+
+class BloomFilter:
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(1, capacity)  # number of values for which the false positive rate is error_rate
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / math.log(2) ** 2))  # in bits
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    # Positions of the bits of a value, from 2 hashes combined (Kirsch-Mitzenmacher double hashing)
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class UserAvailability:
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.capacity = 100_000
+        self.error_rate = 0.01
+        self.refresh = 300
+        self.filter = None
+        self.loaded_on = 0
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('AVAILABILITY_FILTER_ENABLED', True)
+        self.capacity = app.config.get('AVAILABILITY_FILTER_CAPACITY', 100_000)
+        self.error_rate = app.config.get('AVAILABILITY_FILTER_ERROR_RATE', 0.01)
+        self.refresh = app.config.get('AVAILABILITY_FILTER_REFRESH', 300)
+        app.extensions['user_availability'] = self
+        if app.config.get('AVAILABILITY_FILTER_PRELOAD'):
+            self.preload(app)
+
+    # Load the filter now if the user table exists (it does not when the app is created to create the DB)
+    def preload(self, app):
+        from sqlalchemy import inspect
+        from myblog import db
+        from myblog.models import User
+
+        if not self.enabled:
+            return
+        with app.app_context():
+            if not inspect(db.engine).has_table(User.__tablename__):
+                return
+            with self.lock:
+                self.filter = self._load()
+                self.loaded_on = time.monotonic()
+
+    # Names of the fields ('username', 'email') already used by another user than exclude_user_id
+    # Fields given as None are not checked.
+    def taken(self, username=None, email=None, exclude_user_id=None, use_filter=True):
+        from myblog import db
+        from myblog.models import User
+
+        values = {'username': username, 'email': email}
+        bloom = self._get_filter() if use_filter else None
+        if bloom is not None:
+            values = {field: value for field, value in values.items() if value is not None and value in bloom}
+            self._incr('availability.filter_hit' if not values else 'availability.filter_miss')
+        values = {field: value for field, value in values.items() if value is not None}
+        if not values:
+            return set()
+
+        # a single query for both fields, returning only the columns to compare
+        query = db.session.query(User.username, User.email) \
+            .filter(or_(*[getattr(User, field) == value for field, value in values.items()]))
+        if exclude_user_id is not None:
+            query = query.filter(User.id != exclude_user_id)
+        taken = set()
+        for row in query.limit(2):
+            taken.update(field for field, value in values.items() if getattr(row, field) == value)
+        return taken
+
+    # Record the values of a new or updated user (call it after the commit)
+    def add(self, username, email):
+        # with the lock, so a value added while the filter is being reloaded goes to the new filter
+        with self.lock:
+            if self.filter is not None:
+                self.filter.add(username)
+                self.filter.add(email)
+
+    def _get_filter(self):
+        if not self.enabled:
+            return None
+        bloom = self.filter
+        expired = time.monotonic() - self.loaded_on > self.refresh
+        if bloom is None or expired or bloom.count > bloom.capacity:
+            # only one thread loads the filter, the others keep using the previous one (or the DB if there is none)
+            if self.lock.acquire(blocking=False):
+                try:
+                    self.filter = bloom = self._load()
+                    self.loaded_on = time.monotonic()
+                finally:
+                    self.lock.release()
+        return bloom
+
+    def _load(self):
+        from myblog import db
+        from myblog.models import User
+
+        start = time.perf_counter()
+        user_count = db.session.query(User.id).count()
+        # 2 values per user, with room for as many new users as existing ones
+        bloom = BloomFilter(2 * max(self.capacity, 2 * user_count), self.error_rate)
+        for username, email in db.session.query(User.username, User.email).yield_per(10_000):
+            bloom.add(username)
+            bloom.add(email)
+        self._observe('availability.filter_load', time.perf_counter() - start)
+        return bloom
+
+    def _incr(self, name):
+        instrumentation = current_app.extensions.get('instrumentation')
+        if instrumentation:
+            instrumentation.incr(name)
+
+    def _observe(self, name, seconds):
+        instrumentation = current_app.extensions.get('instrumentation')
+        if instrumentation:
+            instrumentation.observe(name, seconds)
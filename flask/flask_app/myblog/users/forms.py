@@ -5,7 +5,26 @@ from wtforms.validators import DataRequired, Length, Email, EqualTo
 from flask_login import current_user
 
 # import user DB model for unique validation
+from myblog import avatars, availability
 from myblog.models import User
+from myblog.users.images import InvalidImage
+
+
+TAKEN_MESSAGES = {
+    'username': 'This username is already used, please choose a different one.',
+    'email': 'This email is already used, please choose a different one.',
+}
+
+
+# Check that the username and email of a form are not used by another user, with a single query
+# (or no query at all when the availability filter knows they are free, see users/availability.py)
+# Only the fields without other errors are checked, their error is added if they are taken.
+def check_availability(form, exclude_user_id=None, use_filter=True, **values):
+    values = {field: value for field, value in values.items() if not form[field].errors}
+    taken = availability.taken(exclude_user_id=exclude_user_id, use_filter=use_filter, **values)
+    for field in taken:
+        form[field].errors.append(TAKEN_MESSAGES[field])
+    return not taken
 
 
 # Form for the registration of a new user
@@ -16,17 +35,10 @@ class SignupForm(FlaskForm):
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo("password")])
     submit = SubmitField('Signup')
 
-    # custom validator for "username" field, automatically called (because it is called validate_username)
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('This username is already used, please choose a different one.')
-
-    # custom validator for "email" field, automatically called (because it is called validate_email)
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('This email is already used, please choose a different one.')
+    # validation of the whole form : the username and email are checked together once the fields are valid
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        return check_availability(self, username=self.username.data, email=self.email.data) and valid
 
 
 # Form for the login of a registered user
@@ -44,21 +56,24 @@ class UpdateAccountForm(FlaskForm):
     picture = FileField('Update profile picture', validators=[FileAllowed(['jpg', 'png'])])
     submit = SubmitField('Update')
 
-    # custom validator for "username" field, automatically called (because it is called validate_username)
-    def validate_username(self, username):
-        # if the username did not change, dont validate
-        if username.data != current_user.username:
-            user = User.query.filter_by(username=username.data).first()
-            if user:
-                raise ValidationError('This username is already used, please choose a different one.')
-
-    # custom validator for "email" field, automatically called (because it is called validate_email)
-    def validate_email(self, email):
-        # if the email did not change, dont validate
-        if email.data != current_user.email:
-            user = User.query.filter_by(email=email.data).first()
-            if user:
-                raise ValidationError('This email is already used, please choose a different one.')
+    # validation of the whole form : the username and email are checked together once the fields are valid
+    def validate(self, extra_validators=None):
+        valid = super().validate(extra_validators)
+        # if the username or the email did not change, dont validate it
+        values = {}
+        if self.username.data != current_user.username:
+            values['username'] = self.username.data
+        if self.email.data != current_user.email:
+            values['email'] = self.email.data
+        return check_availability(self, exclude_user_id=current_user.id, **values) and valid
+
+    # custom validator for "picture" field, checking the file size and image dimensions without decoding it
+    def validate_picture(self, picture):
+        if picture.data:
+            try:
+                avatars.check(picture.data)
+            except InvalidImage as e:
+                raise ValidationError(str(e))
 
 
 # Form to request a password reset for a given email
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+
+# Password hashing with bcrypt in a dedicated pool of processes
+#
+# A bcrypt hash takes 100-300ms of CPU on purpose (it is what makes brute force attacks slow).
+# When it runs in the request thread, it holds the GIL and slows down all the other requests of the worker.
+# Instead, we send the hashing jobs to a small pool of processes, and the request thread just waits for the
+# result without holding the GIL, so other routes keep being served during a burst of logins.
+#
+# The number of jobs sent to the pool at the same time is limited to HASHING_POOL_MAX_PENDING, requests
+# that cannot get a slot within HASHING_POOL_TIMEOUT get a 503 response.
+# With HASHING_POOL_WORKERS = 0 the hashes are computed inline in the request thread (no pool).
+#
+# The cost of the hashes is BCRYPT_LOG_ROUNDS, and hashes with a different cost are upgraded on login.
+# bcrypt is imported by the first hash, in the process computing it.
+
+
+class HashingPoolBusy(ServiceUnavailable):
+    description = 'Too many authentication requests, please try again in a few seconds.'
+
+
+# These functions run in the pool processes, so they must be defined at module level to be picklable
+def _hash_password(password, rounds):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(pw_hash, password):
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), pw_hash.encode('utf-8'))
+
+
+# The cost is stored in the hash itself : $2b$12$<salt and hash>
+def hash_cost(pw_hash):
+    return int(pw_hash.split('$')[2])
+
+
+class PasswordHasher:
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.workers = 0
+        self.timeout = None
+        self.slots = None
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.executor = None
+        self.executor_pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = app.config.get('HASHING_POOL_WORKERS', 0)
+        self.timeout = app.config.get('HASHING_POOL_TIMEOUT', 5)
+        self.slots = threading.BoundedSemaphore(app.config.get('HASHING_POOL_MAX_PENDING', 2 * max(1, self.workers)))
+        app.extensions['password_hasher'] = self
+
+    def generate_password_hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check_password_hash(self, pw_hash, password):
+        return self._run(_check_password, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        return hash_cost(pw_hash) != self.rounds
+
+    def _get_executor(self):
+        # the pool is created on first use, and re-created in processes forked after that (like prefork servers)
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        instrumentation = current_app.extensions.get('instrumentation')
+        start = time.perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            if instrumentation:
+                instrumentation.incr('hashing.rejected')
+            raise HashingPoolBusy()
+        try:
+            with self.lock:
+                self.pending += 1
+                if instrumentation:
+                    instrumentation.gauge('hashing.queue_depth', self.pending)
+            queued = time.perf_counter()
+            result = self._get_executor().submit(func, *args).result()
+            if instrumentation:
+                instrumentation.observe('hashing.wait', queued - start)
+                instrumentation.observe('hashing.run', time.perf_counter() - queued)
+            return result
+        finally:
+            with self.lock:
+                self.pending -= 1
+                if instrumentation:
+                    instrumentation.gauge('hashing.queue_depth', self.pending)
+            self.slots.release()
@@ -0,0 +1,185 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger(__name__)
+
+
+# Processing of the profile pictures uploaded by the users
+#
+#  - the upload is checked (file size, image format and pixel count) by reading only its header, before
+#    anything is decoded, so a huge image or a decompression bomb is rejected early
+#  - the files are named from a hash of their content, so an image uploaded several times is stored once
+#  - the resizing runs in background threads, the request only checks the image and returns
+#  - the state of the background jobs is kept in a SQLite file (AVATAR_STATUS_PATH) shared by the processes of the
+#    machine (like the pictures) : the last upload of each user, so that an older upload finishing later does not
+#    replace a newer picture, and the failures, displayed to the user on the account page
+#  - large JPEG images are decoded at a reduced resolution (draft mode), much faster than a full decode
+#  - each avatar is saved in several sizes (AVATAR_SIZES), in JPEG and WebP
+#
+# The file stored in User.image_file is <hash>.jpg, the AVATAR_DEFAULT_SIZE version used by the templates.
+# The other versions are <hash>_<size>.jpg and <hash>_<size>.webp in the same folder.
+#
+# Pillow is imported on first use, only the processes receiving uploads need it.
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class AvatarPipeline:
+
+    def __init__(self, app=None):
+        self.executor = None
+        self.executor_pid = None
+        self.status = None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.folder = os.path.join(app.root_path, 'static/images')
+        self.default_size = app.config.get('AVATAR_DEFAULT_SIZE', 125)
+        self.sizes = set(app.config.get('AVATAR_SIZES', (64, 125, 250))) | {self.default_size}
+        self.max_bytes = app.config.get('AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+        self.max_pixels = app.config.get('AVATAR_MAX_PIXELS', 25_000_000)
+        self.workers = app.config.get('AVATAR_WORKERS', 2)
+        self.status_path = app.config.get('AVATAR_STATUS_PATH', 'avatar_status.db')
+        self.status_ttl = app.config.get('AVATAR_STATUS_TTL', 24 * 3600)
+        self.status = None
+        app.extensions['avatar_pipeline'] = self
+
+    # Check an uploaded file without decoding it, raise InvalidImage if it cannot be used as an avatar
+    def check(self, picture):
+        from PIL import Image  # part of Pillow (Python Imaging Library)
+
+        picture.stream.seek(0, os.SEEK_END)
+        size = picture.stream.tell()
+        picture.stream.seek(0)
+        if size > self.max_bytes:
+            raise InvalidImage(f'The picture is too large (max {self.max_bytes // (1024 * 1024)} MB).')
+        try:
+            # open() only reads the header of the image, the pixels are decoded on first access
+            with Image.open(picture.stream) as image:
+                width, height = image.size
+                image_format = image.format
+        except (OSError, Image.DecompressionBombError):
+            raise InvalidImage('The picture is not a valid image.')
+        finally:
+            picture.stream.seek(0)
+        if image_format not in ('JPEG', 'PNG'):
+            raise InvalidImage('Only JPEG and PNG pictures are supported.')
+        if width * height > self.max_pixels:
+            raise InvalidImage(f'The picture is too large ({width}x{height} pixels).')
+
+    # Store an uploaded picture as the avatar of a user, whose current picture is current_file
+    # Return the file name if this image was already processed (or is processed in the request), otherwise the
+    # processing is started in background, it updates the user picture when done, and None is returned.
+    # Raise InvalidImage if the picture cannot be decoded (only its header was checked by check()).
+    def save(self, picture, user_id, current_file):
+        data = picture.stream.read(self.max_bytes + 1)
+        if len(data) > self.max_bytes:
+            raise InvalidImage('The picture is too large.')
+        key = hashlib.sha256(data).hexdigest()[:16]
+        file_name = f'{key}.jpg'
+        if self.workers:
+            # this upload replaces the ones still processed in background
+            self._get_status().delete(f'failed:{user_id}')
+            self._get_status().delete(f'pending:{user_id}')
+        if os.path.exists(os.path.join(self.folder, file_name)):
+            return file_name
+        if not self.workers:
+            self._process(data, key)
+            return file_name
+        self._get_status().set(f'pending:{user_id}', key)
+        self._get_executor().submit(self._process_and_update, data, key, user_id, current_file)
+        return None
+
+    # Error message of the last background processing of the user if it failed (returned once), or None
+    def pop_failure(self, user_id):
+        if not self.workers:
+            return None
+        message = self._get_status().get(f'failed:{user_id}')
+        if message is not None:
+            self._get_status().delete(f'failed:{user_id}')
+        return message
+
+    def _get_status(self):
+        from myblog.cache import SqliteCacheBackend
+        with self.lock:
+            if self.status is None:
+                self.status = SqliteCacheBackend(self.status_path, default_ttl=self.status_ttl)
+            return self.status
+
+    def _get_executor(self):
+        # the threads are created on first use, and again in processes forked after that
+        with self.lock:
+            if self.executor is None or self.executor_pid != os.getpid():
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='avatars')
+                self.executor_pid = os.getpid()
+            return self.executor
+
+    # Process a picture in background, and make it the picture of the user, unless the user uploaded another one
+    # since (the last upload is in the status), or the picture changed in the meantime (expected_file)
+    def _process_and_update(self, data, key, user_id, expected_file):
+        from myblog import db, page_cache, user_cache
+        from myblog.models import User
+        from myblog.posts.counters import touch_posts
+        try:
+            self._process(data, key)
+            status = self._get_status()
+            if status.get(f'pending:{user_id}') != key:
+                return
+            with self.app.app_context():
+                updated = User.query.filter_by(id=user_id, image_file=expected_file) \
+                    .update({'image_file': f'{key}.jpg'})
+                if updated:
+                    touch_posts(user_id)
+                    db.session.commit()
+                    user_cache.invalidate(user_id)
+                    page_cache.invalidate_posts(user_id)
+                db.session.remove()
+            status.delete(f'pending:{user_id}')
+        except Exception as e:
+            logger.exception('Failed to process the avatar %s of user %s', key, user_id)
+            status = self._get_status()
+            if status.get(f'pending:{user_id}') == key:
+                message = str(e) if isinstance(e, InvalidImage) else 'The picture could not be processed.'
+                status.set(f'failed:{user_id}', message)
+                status.delete(f'pending:{user_id}')
+
+    def _process(self, data, key):
+        from PIL import Image
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.format == 'JPEG':
+                # let the JPEG decoder skip the details we do not need : it decodes at the smallest scale
+                # (1/2, 1/4 or 1/8) that is still larger than the biggest avatar size
+                image.draft('RGB', (max(self.sizes), max(self.sizes)))
+            image = image.convert('RGB')
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            # the header was checked, but the pixels cannot be decoded (truncated or corrupt file)
+            raise InvalidImage('The picture is not a valid image.') from e
+
+        for size in sorted(self.sizes, reverse=True):
+            # resize from the previous (bigger) version, cheaper than from the original
+            image.thumbnail((size, size))
+            self._write(image, f'{key}_{size}.jpg', 'JPEG', quality=85, optimize=True)
+            self._write(image, f'{key}_{size}.webp', 'WEBP', quality=80)
+            if size == self.default_size:
+                default = image.copy()
+        # the default file is written last, its presence means that all the versions exist
+        self._write(default, f'{key}.jpg', 'JPEG', quality=85, optimize=True)
+
+    def _write(self, image, file_name, image_format, **options):
+        # write to a temporary file then rename it, so a file is never served half written
+        path = os.path.join(self.folder, file_name)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        image.save(tmp_path, image_format, **options)
+        os.replace(tmp_path, path)
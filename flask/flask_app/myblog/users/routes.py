@@ -1,12 +1,15 @@
 from flask import request, render_template, redirect, flash, url_for, Blueprint
 from flask_login import login_user, logout_user, current_user, login_required
+from sqlalchemy.exc import IntegrityError
 
 # import "db" and "app" defined in the __init__.py, and other modules from the package
 # Note : for some reason the import of myblog package is flagged as an error in Pycharm
-from myblog import db, bcrypt, mail
+from myblog import db, hasher, avatars, availability, page_cache, user_cache
 from myblog.models import User
-from myblog.users.forms import SignupForm, LoginForm, UpdateAccountForm, RequestResetForm, ResetPasswordForm
-from myblog.users.utils import save_picture, send_reset_email
+from myblog.posts.counters import touch_posts
+from myblog.users.forms import check_availability, SignupForm, LoginForm, UpdateAccountForm, RequestResetForm, ResetPasswordForm
+from myblog.users.images import InvalidImage
+from myblog.users.utils import send_reset_email
 
 
 # The name "users" used for the blueprint is the prefix to use in all calls of url_for()
@@ -25,10 +28,18 @@ def signup_handler():
     # check if the method is POST and the provided data are valid
     if form.validate_on_submit():
         # create the user in DB with its password hash
-        pwd_hash = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        pwd_hash = hasher.generate_password_hash(form.password.data)
         user = User(username=form.username.data, email=form.email.data, password_hash=pwd_hash)
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # the username or email was just taken by another request (the unique constraints are the reference)
+            db.session.rollback()
+            if check_availability(form, use_filter=False, username=form.username.data, email=form.email.data):
+                flash('Account creation failed, please try again.', 'danger')
+            return render_template('signup.html', title="Signup", form=form)
+        availability.add(user.username, user.email)
         # send a temporary success alert to the frontend
         flash(f'Account created for {form.username.data}, please login.', 'success')
         return redirect(url_for('users.login_handler'))
@@ -48,7 +59,11 @@ def login_handler():
     # check if the method is POST and the provided data are valid
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password_hash, form.password.data):
+        if user and hasher.check_password_hash(user.password_hash, form.password.data):
+            # re-hash the password if the configured cost changed since it was hashed
+            if hasher.needs_rehash(user.password_hash):
+                user.password_hash = hasher.generate_password_hash(form.password.data)
+                db.session.commit()
             # login the user using Flask-Login extension
             login_user(user, remember=form.remember_me.data)
             flash(f'Logged as {form.email.data}!', 'success')
@@ -76,20 +91,50 @@ def logout_handler():
 def account_handler():
     form = UpdateAccountForm()
     if form.validate_on_submit():
+        # the username and the picture are displayed in the posts listing
+        posts_changed = form.picture.data or form.username.data != current_user.username
         if form.picture.data:
-            # save the file in the images folder
-            file_name = save_picture(form.picture.data)
-            # Update the DB with this file
-            current_user.image_file = file_name
+            # save the file in the images folder (resized in background unless the same image already exists)
+            try:
+                file_name = avatars.save(form.picture.data, current_user.id, current_user.image_file)
+            except InvalidImage as e:
+                # the pictures processed in the request are decoded here, after the validation of the form
+                form.picture.errors.append(str(e))
+                image_path = url_for('static', filename='images/' + current_user.image_file)
+                return render_template('account.html', title='Account', image_path=image_path, form=form)
+            if file_name:
+                # Update the DB with this file
+                current_user.image_file = file_name
+            else:
+                flash('Your new picture is being processed, it will be visible in a few seconds.', 'info')
         current_user.username = form.username.data
         current_user.email = form.email.data
-        db.session.commit()
+        if posts_changed:
+            touch_posts(current_user.id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # the new username or email was just taken by another request
+            db.session.rollback()
+            if check_availability(form, exclude_user_id=current_user.id, use_filter=False,
+                                  username=form.username.data, email=form.email.data):
+                flash('Your account could not be updated, please try again.', 'danger')
+            image_path = url_for('static', filename='images/' + current_user.image_file)
+            return render_template('account.html', title='Account', image_path=image_path, form=form)
+        availability.add(current_user.username, current_user.email)
+        user_cache.invalidate(current_user.id)
+        if posts_changed:
+            page_cache.invalidate_posts(current_user.id)
         flash('Your account has been updated', 'success')
         return redirect(url_for('users.account_handler'))
     elif request.method == 'GET':
         # pre-populate the username and email
         form.username.data = current_user.username
         form.email.data = current_user.email
+        # the last picture uploaded may have failed in background
+        failure = avatars.pop_failure(current_user.id)
+        if failure:
+            flash(f'Your new picture could not be used : {failure}', 'danger')
 
     image_path = url_for('static', filename='images/' + current_user.image_file)
     return render_template('account.html', title='Account', image_path=image_path, form=form)
@@ -117,9 +162,10 @@ def reset_password_handler(token):
 
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        pwd_hash = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        pwd_hash = hasher.generate_password_hash(form.password.data)
         user.password_hash = pwd_hash
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash(f'Your password has been updated, please login.', 'success')
         return redirect(url_for('users.login_handler'))
     return render_template('reset_password.html', title='Reset Password', form=form)
@@ -11,5 +11,7 @@ from myblog import create_app
 
 app = create_app()
 
+# This starts the development server of Flask (one process, with the debugger and the reloader)
+# In production, the webapp is served by gunicorn with wsgi.py and gunicorn.conf.py
 if __name__ == '__main__':
     app.run(debug=True)
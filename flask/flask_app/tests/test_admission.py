@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from myblog import admission, instrumentation
+from myblog.admission import AdmissionPool
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'ADMISSION_CONTROL': True,
+        'ADMISSION_POOLS': {
+            'reads': {'endpoints': ('posts.get_posts_handler',), 'concurrency': 1, 'queue': 1, 'timeout': 0.05},
+        },
+        'ADMISSION_RETRY_AFTER': 7,
+        'INSTRUMENTATION_ENABLED': True,
+        'INSTRUMENTATION_DUMP_PATH': None,
+    }
+
+
+@pytest.fixture
+def reads_pool(app):
+    instrumentation.reset()
+    return admission.pool_for('posts.get_posts_handler', 'posts', 'GET')
+
+
+def test_pool_queue_and_timeout():
+    pool = AdmissionPool('test', concurrency=1, queue=1, timeout=0.05)
+    assert pool.acquire()[0]
+
+    # the queue has room : the request waits until the timeout, then it is rejected
+    admitted, waited = pool.acquire()
+    assert not admitted and waited >= 0.05
+    assert pool.waiting == 0
+
+    # a request waiting in the queue gets the slot when it is released
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(pool.acquire()))
+    pool.timeout = 5
+    waiter.start()
+    while pool.waiting == 0:
+        time.sleep(0.001)
+    # the queue is full : rejected without waiting
+    assert pool.acquire() == (False, pytest.approx(0, abs=0.01))
+    pool.release()
+    waiter.join()
+    assert results[0][0] and pool.active == 1
+
+
+def test_rejected_request(client, authors, reads_pool):
+    assert reads_pool.acquire()[0]
+    response = client.get('/posts')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '7'
+    # the other endpoints are not limited
+    assert client.get('/').status_code == 200
+    reads_pool.release()
+
+    assert client.get('/posts').status_code == 200
+    # the slot is released at the end of the request, even when the handler fails
+    assert client.get('/posts?user=999').status_code == 404
+    assert reads_pool.active == 0
+
+    stats = instrumentation.snapshot()
+    assert stats['counters']['admission.reads.admitted'] == 2
+    assert stats['counters']['admission.reads.rejected'] == 1
+    # the wait of the rejected request is recorded too
+    assert stats['observations']['admission.reads.wait']['count'] == 3
+    assert stats['gauges']['admission.reads.waiting'] == 0
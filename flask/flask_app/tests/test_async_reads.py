@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import event
+
+from myblog import async_db
+from myblog.aio import async_sqlite_pragmas
+
+
+@pytest.fixture
+def app_config():
+    return {'ASYNC_READS': True}
+
+
+# SQL statements run by the async engine on its new connections, then by the views
+@pytest.fixture
+def statements(app):
+    executed = []
+    event.listen(async_db.engine.sync_engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: executed.append(statement))
+    return executed
+
+
+def test_async_listing(client, authors):
+    response = client.get('/posts')
+    assert response.status_code == 200
+    assert b'Post 0' in response.data and b'Post 2' in response.data
+
+    response = client.get(f'/posts?user={authors[1]}')
+    assert response.status_code == 200
+    assert b'Post 1' in response.data
+    assert b'Post 0' not in response.data
+
+
+def test_async_search(client, authors):
+    response = client.get('/posts/search?q=number+1')
+    assert response.status_code == 200
+    assert b'Post 1' in response.data
+    assert b'Post 0' not in response.data
+
+
+# Each view opens its own connection, which only runs the pragmas that matter for reads
+def test_async_connections(client, authors, statements):
+    for _ in range(2):
+        assert client.get('/posts').status_code == 200
+    assert not [statement for statement in statements if statement.startswith('PRAGMA')]
+    assert async_db.engine.pool.status() == 'NullPool'
+
+    assert async_sqlite_pragmas({'SQLITE_MMAP_SIZE': 2 ** 20}) == ['PRAGMA mmap_size=1048576']
@@ -0,0 +1,20 @@
+from myblog import availability, db
+
+
+# The filter is loaded when the app is created, not by the first signup
+def test_filter_preloaded(make_app, app, authors):
+    availability.filter = None
+    make_app()
+    assert availability.filter is not None
+    assert 'author0' in availability.filter and 'author2@example.com' in availability.filter
+
+
+# An app created to create the DB has no user table yet, the filter is loaded on first use
+def test_filter_without_user_table(make_app):
+    availability.filter = None
+    app = make_app()
+    assert availability.filter is None
+    with app.app_context():
+        db.create_all()
+        assert availability.taken(username='author0') == set()
+    assert availability.filter is not None
@@ -0,0 +1,92 @@
+import io
+
+import pytest
+from PIL import Image
+
+from myblog import avatars, db
+from myblog.models import User
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    return {'AVATAR_WORKERS': 1, 'AVATAR_STATUS_PATH': str(tmp_path / 'avatar_status.db')}
+
+
+# The pictures are written in the temporary folder of the test
+@pytest.fixture(autouse=True)
+def avatars_folder(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(avatars, 'folder', str(tmp_path))
+
+
+def png(color):
+    data = io.BytesIO()
+    Image.new('RGB', (300, 200), color).save(data, 'PNG')
+    return data.getvalue()
+
+
+# A valid PNG header, but the pixels are missing
+def truncated_png():
+    return png('red')[:80]
+
+
+def upload(client, data, follow_redirects=True):
+    return client.post('/account', content_type='multipart/form-data', follow_redirects=follow_redirects, data={
+        'username': 'author0', 'email': 'author0@example.com', 'picture': (io.BytesIO(data), 'picture.png')})
+
+
+def image_file(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).image_file
+
+
+# Wait for the end of the background processing (the pool has a single thread)
+def wait_for_avatars():
+    avatars._get_executor().submit(lambda: None).result()
+
+
+def test_background_processing(app, client, authors, login):
+    login('author0@example.com')
+    response = upload(client, png('blue'))
+    assert b'Your new picture is being processed' in response.data
+    wait_for_avatars()
+    assert image_file(app, authors[0]).endswith('.jpg') and image_file(app, authors[0]) != 'default.jpg'
+
+
+# A failure in background is displayed on the account page, once
+def test_background_failure(app, client, authors, login):
+    login('author0@example.com')
+    upload(client, truncated_png(), follow_redirects=False)
+    wait_for_avatars()
+    assert image_file(app, authors[0]) == 'default.jpg'
+    assert b'Your new picture could not be used : The picture is not a valid image.' in client.get('/account').data
+    assert b'could not be used' not in client.get('/account').data
+
+
+# Processed in the request, a corrupt picture is a form error
+def test_corrupt_picture_in_request(app, client, authors, login):
+    app.config['AVATAR_WORKERS'] = avatars.workers = 0
+    login('author0@example.com')
+    response = upload(client, truncated_png())
+    assert response.status_code == 200
+    assert b'The picture is not a valid image.' in response.data
+    assert image_file(app, authors[0]) == 'default.jpg'
+
+
+# An older upload finishing after a newer one does not replace it
+def test_older_upload_finishing_last(app, authors):
+    user_id = authors[0]
+    avatars._get_status().set(f'pending:{user_id}', 'newer')
+    avatars._process_and_update(png('green'), 'older', user_id, 'default.jpg')
+    assert image_file(app, user_id) == 'default.jpg'
+
+    # the picture was changed by the request of an upload already processed
+    avatars._get_status().set(f'pending:{user_id}', 'older')
+    with app.app_context():
+        User.query.filter_by(id=user_id).update({'image_file': 'newer.jpg'})
+        db.session.commit()
+    avatars._process_and_update(png('green'), 'older', user_id, 'default.jpg')
+    assert image_file(app, user_id) == 'newer.jpg'
+
+    avatars._get_status().set(f'pending:{user_id}', 'latest')
+    avatars._process_and_update(png('green'), 'latest', user_id, 'newer.jpg')
+    assert image_file(app, user_id) == 'latest.jpg'
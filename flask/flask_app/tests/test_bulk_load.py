@@ -0,0 +1,64 @@
+import pytest
+from sqlalchemy import inspect, text
+
+from myblog import bulk_load, db, hasher
+from myblog.posts.counters import total_posts
+
+
+@pytest.fixture
+def load(app):
+    def load_data(users=5, posts=50):
+        with app.app_context():
+            # the loader gets the only connection of the pool, which is checked below
+            db.engine.dispose()
+            password_hash = hasher.generate_password_hash('password')  # default password of the login fixture
+            bulk_load.load_synthetic_data(db.engine, users, posts, password_hash, batch_size=20)
+    return load_data
+
+
+# Indexes and full-text triggers of the posts table, and synchronous setting of the pooled connection
+def db_state(app):
+    with app.app_context():
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('blog_post')}
+        with db.engine.connect() as connection:
+            triggers = {row[0] for row in connection.execute(text(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'blog_post'"))}
+            synchronous = connection.execute(text('PRAGMA synchronous')).scalar()
+    return indexes, triggers, synchronous
+
+
+def assert_restored(app):
+    indexes, triggers, synchronous = db_state(app)
+    assert indexes == {'ix_blog_post_created_on_id', 'ix_blog_post_user_id_created_on_id'}
+    assert triggers == {'blog_post_fts_insert', 'blog_post_fts_delete', 'blog_post_fts_update'}
+    assert synchronous == 1  # NORMAL, from the pragmas of the engine
+
+
+def test_load(app, client, load, login):
+    load()
+    assert_restored(app)
+    with app.app_context():
+        assert total_posts() == 50
+
+    # the ids of the new rows follow the loaded ones
+    login('user0000001@example.com')
+    response = client.post('/posts/create', data={'title': 'After the load', 'content': 'New post'})
+    assert response.status_code == 302
+    response = client.get('/posts/search?q=after+load')
+    assert b'After the load' in response.data
+
+
+# A failed load keeps the rows of the committed transactions, and the indexes and triggers are created again
+def test_failed_load(app, load, monkeypatch):
+    generate_posts = bulk_load.generate_posts
+
+    def failing_posts(*args, **kwargs):
+        for i, post in enumerate(generate_posts(*args, **kwargs)):
+            if i == 30:
+                raise RuntimeError('load interrupted')
+            yield post
+    monkeypatch.setattr(bulk_load, 'generate_posts', failing_posts)
+
+    with pytest.raises(RuntimeError, match='load interrupted'):
+        load()
+    assert_restored(app)
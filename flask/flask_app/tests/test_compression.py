@@ -0,0 +1,85 @@
+import gzip
+import zlib
+
+import pytest
+from flask import Response
+
+from myblog import compression
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+@pytest.fixture
+def app_config():
+    return {'EXPORT_BATCH_SIZE': 1}
+
+
+# gzip only, whether brotli is installed or not
+@pytest.fixture(autouse=True)
+def without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, '_get_brotli', lambda: None)
+
+
+def test_negotiation(client, authors):
+    identity = client.get('/posts')
+    assert 'Content-Encoding' not in identity.headers
+    assert 'Accept-Encoding' in identity.headers['Vary']
+
+    response = client.get('/posts', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(identity.data)
+    assert gzip.decompress(response.data) == identity.data
+
+    # gzip refused by the client
+    response = client.get('/posts', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_small_and_encoded_responses(app, client):
+    app.add_url_rule('/_small', 'small', lambda: 'small page')
+    app.add_url_rule('/_encoded', 'encoded', lambda: Response('x' * 1000, headers={'Content-Encoding': 'br'}))
+    response = client.get('/_small', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == b'small page'
+
+    response = client.get('/_encoded', headers=GZIP)
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.data == b'x' * 1000
+
+
+# A strong ETag gets the encoding as suffix, the weak ETags of the listings are kept
+def test_etags(app, client, authors):
+    def strong():
+        response = Response('x' * 1000)
+        response.set_etag('page')
+        return response
+    app.add_url_rule('/_strong', 'strong', strong)
+    assert client.get('/_strong', headers=GZIP).headers['ETag'] == '"page-gzip"'
+    assert client.get('/_strong').headers['ETag'] == '"page"'
+
+    response = client.get('/posts', headers=GZIP)
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    response = client.get('/posts', headers=dict(GZIP, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+    assert 'Content-Encoding' not in response.headers
+
+
+# The streamed exports are compressed chunk by chunk : each chunk can be decompressed as soon as it is received
+def test_streamed_export(client, authors, login):
+    login('author0@example.com')
+    identity = client.get('/export/posts.ndjson').data
+    assert identity.count(b'\n') == 3
+
+    response = client.get('/export/posts.ndjson', headers=GZIP, buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    received = []
+    for chunk in response.response:
+        received.append(decompressor.decompress(chunk))
+    response.close()
+    # one batch of one row per chunk, each one readable before the end of the stream
+    assert [data for data in received if data][:3] == identity.splitlines(keepends=True)
+    assert b''.join(received) + decompressor.flush() == identity
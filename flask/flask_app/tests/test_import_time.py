@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.import_time import (BASELINE, LAZY_MODULES, ROUTES_MODULES, SCENARIOS, imported,
+                                    median_measure)
+
+# Import time budget of the webapp, see benchmarks/import_time.py (each run starts a new interpreter)
+
+REPEAT = 3
+
+
+@pytest.fixture(scope='module')
+def baseline_ms():
+    return median_measure(BASELINE, REPEAT)[0]
+
+
+@pytest.mark.parametrize('name', list(SCENARIOS))
+def test_import_time(name, baseline_ms):
+    code, ratio = SCENARIOS[name]
+    total_ms, modules = median_measure(code, REPEAT)
+    assert imported(modules, LAZY_MODULES) == []
+    if 'create_app()' not in code:
+        assert imported(modules, ROUTES_MODULES) == []
+    assert total_ms <= baseline_ms * ratio, f'{total_ms:.1f}ms, over the budget of {baseline_ms * ratio:.0f}ms'
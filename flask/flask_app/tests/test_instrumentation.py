@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from myblog import db, instrumentation
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'INSTRUMENTATION_ENABLED': True,
+        'INSTRUMENTATION_STATS_ENDPOINT': True,
+        'INSTRUMENTATION_STATS_ADMINS': ('author0@example.com',),
+        'INSTRUMENTATION_DUMP_PATH': None,
+    }
+
+
+def test_stats_endpoint_access(client, authors, login):
+    assert client.get('/_stats').status_code == 200
+    remote = {'REMOTE_ADDR': '203.0.113.5'}
+    assert client.get('/_stats', environ_base=remote).status_code == 403
+    assert client.get('/_stats', headers={'X-Forwarded-For': '203.0.113.5'}).status_code == 403
+
+    login('author1@example.com')
+    assert client.get('/_stats', environ_base=remote).status_code == 403
+    client.get('/logout')
+    login('author0@example.com')
+    response = client.get('/_stats', environ_base=remote)
+    assert response.status_code == 200
+    assert 'users.login_handler' in response.get_json()['endpoints']
+
+
+# A failed statement must not leave its start time behind for the timing of the next statements
+def test_failed_query_does_not_change_next_timings(app, client, authors):
+    instrumentation.reset()
+    with app.app_context():
+        connection = db.engine.connect()
+        with pytest.raises(OperationalError):
+            connection.execute(text('SELECT * FROM missing_table'))
+        assert not [key for key in connection.connection.info if key.startswith('instr')]
+        assert connection.execute(text('SELECT 1')).scalar() == 1
+        connection.close()
+    assert client.get('/posts').status_code == 200
+    stats = client.get('/_stats').get_json()['endpoints']['posts.get_posts_handler']
+    assert stats['requests'] == 1
+    assert stats['sql_ms_per_request'] < 1000
@@ -0,0 +1,151 @@
+import smtplib
+import threading
+import time
+
+import pytest
+from flask_mail import Message
+
+from myblog.mail_queue import MailQueue
+
+
+# Local stand-in for the SMTP server, replacing smtplib.SMTP : it records the connections and the messages sent,
+# and can refuse the next connections or logins
+class SmtpServer:
+
+    def __init__(self):
+        self.connections = []
+        self.attempts = 0
+        self.failures = 0
+        self.login_failures = 0
+        self.gate = None  # when set, the connections wait for it
+
+    def connect(self, host, port, timeout=None):
+        self.attempts += 1
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionRefusedError('Connection refused')
+        connection = SmtpConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    @property
+    def messages(self):
+        return [message for connection in self.connections for message in connection.messages]
+
+
+class SmtpConnection:
+
+    def __init__(self, server):
+        self.server = server
+        self.messages = []
+        self.closed = False
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        if self.server.login_failures:
+            self.server.login_failures -= 1
+            raise smtplib.SMTPAuthenticationError(535, b'Authentication failed')
+
+    def sendmail(self, sender, recipients, body):
+        self.messages.append((sender, recipients, body))
+
+    def quit(self):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    server = SmtpServer()
+    monkeypatch.setattr(smtplib, 'SMTP', server.connect)
+    return server
+
+
+@pytest.fixture
+def mail_queue(app, smtp_server):
+    app.config.update(MAIL_SUPPRESS_SEND=False, MAIL_QUEUE_ENABLED=True, MAIL_QUEUE_BATCH_SIZE=10,
+                      MAIL_QUEUE_RETRIES=3, MAIL_QUEUE_BACKOFF=0.01)
+    return MailQueue(app)
+
+
+def send(app, mail_queue, count):
+    with app.app_context():
+        for i in range(count):
+            mail_queue.send(Message(subject=f'Message {i}', recipients=[f'user{i}@example.com'],
+                                    body='Hello', sender='noreply@demo.com'))
+
+
+def test_send_returns_before_delivery(app, mail_queue, smtp_server):
+    smtp_server.gate = threading.Event()
+    send(app, mail_queue, 1)
+    assert smtp_server.messages == []
+    smtp_server.gate.set()
+    mail_queue.flush()
+    assert [recipients for _, recipients, _ in smtp_server.messages] == [['user0@example.com']]
+    assert smtp_server.connections[0].closed
+
+
+# The messages queued while the worker is busy are sent together, over a single connection
+def test_batches_over_one_connection(app, mail_queue, smtp_server):
+    smtp_server.gate = threading.Event()
+    send(app, mail_queue, 1)
+    # the worker is connecting to send the first message when the others are queued
+    deadline = time.monotonic() + 5
+    while smtp_server.attempts == 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    send(app, mail_queue, 5)
+    smtp_server.gate.set()
+    mail_queue.flush()
+    assert len(smtp_server.messages) == 6
+    assert [len(connection.messages) for connection in smtp_server.connections] == [1, 5]
+
+
+def test_retries_failed_connections(app, mail_queue, smtp_server):
+    smtp_server.failures = 2
+    send(app, mail_queue, 1)
+    mail_queue.flush()
+    assert smtp_server.attempts == 3
+    assert len(smtp_server.messages) == 1
+
+
+def test_closes_connection_when_login_fails(app, mail_queue, smtp_server):
+    app.config.update(MAIL_USERNAME='user', MAIL_PASSWORD='password')
+    mail_queue = MailQueue(app)
+    smtp_server.login_failures = 1
+    send(app, mail_queue, 1)
+    mail_queue.flush()
+    first, second = smtp_server.connections
+    assert first.closed and first.messages == []
+    assert len(second.messages) == 1
+
+
+def test_gives_up_after_retries(app, mail_queue, smtp_server):
+    smtp_server.failures = 10
+    send(app, mail_queue, 1)
+    mail_queue.flush()
+    assert smtp_server.attempts == 4
+    assert smtp_server.messages == []
+
+
+# A delivery waiting for its retries does not keep flush() longer than its timeout
+def test_flush_timeout(app, mail_queue, smtp_server):
+    app.config.update(MAIL_QUEUE_BACKOFF=10)
+    mail_queue = MailQueue(app)
+    smtp_server.failures = 1
+    send(app, mail_queue, 1)
+    start = time.monotonic()
+    assert mail_queue.flush(timeout=0.2) is False
+    assert time.monotonic() - start < 2
+    assert smtp_server.messages == []
@@ -0,0 +1,31 @@
+from myblog import page_cache
+from myblog.cache import PageCache
+
+
+# Two caches with the memory backend, like in two worker processes : the pages are not shared, but the
+# invalidations made by one are seen by the other
+def test_memory_backend_shares_invalidations(app, tmp_path):
+    app.config.update(PAGE_CACHE_BACKEND='memory', PAGE_CACHE_PATH=str(tmp_path / 'page_cache.db'))
+    worker1, worker2 = PageCache(app), PageCache(app)
+    with app.test_request_context('/posts'):
+        key = worker2.listing_key(-1, 1, None)
+        user_key = worker2.listing_key(4, 1, None)
+        worker2.set(key, 'page')
+        assert worker2.get(key) == 'page'
+        assert worker1.get(key) is None
+
+        worker1.invalidate_posts(3)
+        assert worker2.listing_key(-1, 1, None) != key
+        assert worker2.listing_key(4, 1, None) == user_key
+
+
+def test_listing_cache_invalidated_by_new_post(app, client, authors, login, tmp_path):
+    app.config.update(PAGE_CACHE_BACKEND='memory', PAGE_CACHE_PATH=str(tmp_path / 'page_cache.db'))
+    page_cache.init_app(app)
+    login('author0@example.com')
+    client.get('/')  # displays the flash messages, the pages with flash messages are not cached
+    assert b'New post' not in client.get('/posts').data
+
+    client.post('/posts/create', data={'title': 'New post', 'content': 'Content of the new post'})
+    client.get('/')
+    assert b'New post' in client.get('/posts').data
@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from myblog import db
+from myblog.models import BlogPost, Counter, User
+from myblog.posts.counters import posts_version
+from myblog.posts.routes import validators_from_version
+
+
+def counters(app, user_id):
+    with app.app_context():
+        return (db.session.get(Counter, 'posts').value, db.session.get(User, user_id).post_count,
+                posts_version()[0], posts_version(user_id)[0])
+
+
+# On a new DB the rows of the listing versions do not exist yet, they are created by the first change
+def test_create_post(app, client, authors, login):
+    login('author0@example.com')
+    response = client.post('/posts/create', data={'title': 'New post', 'content': 'Content of the new post'})
+    assert response.status_code == 302
+    assert counters(app, authors[0]) == (4, 2, 1, 1)
+    with app.app_context():
+        assert BlogPost.query.filter_by(title='New post', user_id=authors[0]).count() == 1
+
+    response = client.post('/posts/create', data={'title': 'Another post', 'content': 'Another content'})
+    assert response.status_code == 302
+    assert counters(app, authors[0]) == (5, 3, 2, 2)
+
+
+def test_edit_and_delete_post(app, client, authors, login):
+    login('author1@example.com')
+    with app.app_context():
+        post_id = BlogPost.query.filter_by(user_id=authors[1]).first().id
+
+    response = client.post(f'/posts/edit/{post_id}', data={'title': 'Edited', 'content': 'Edited content'})
+    assert response.status_code == 302
+    assert counters(app, authors[1]) == (3, 1, 1, 1)
+
+    response = client.post(f'/posts/delete/{post_id}')
+    assert response.status_code == 302
+    assert counters(app, authors[1]) == (2, 0, 2, 2)
+    with app.app_context():
+        assert db.session.get(BlogPost, post_id) is None
+
+
+def test_edit_post_of_another_user(client, authors, login):
+    login('author0@example.com')
+    response = client.post('/posts/edit/2', data={'title': 'Edited', 'content': 'Edited content'})
+    assert response.status_code == 403
+
+
+def test_account_rename_changes_listing_version(app, client, authors, login):
+    login('author2@example.com')
+    response = client.post('/account', data={'username': 'renamed2', 'email': 'author2@example.com'})
+    assert response.status_code == 302
+    assert counters(app, authors[2])[2:] == (1, 1)
+    assert b'renamed2' in client.get('/posts').data
+
+
+def test_listing_conditional_get(app, client, authors, login):
+    response = client.get('/posts')
+    etag = response.headers['ETag']
+    assert client.get('/posts', headers={'If-None-Match': etag}).status_code == 304
+
+    login('author0@example.com')
+    client.post('/posts/create', data={'title': 'New post', 'content': 'Content of the new post'})
+    client.get('/logout', follow_redirects=True)  # displays the flash messages
+    response = client.get('/posts', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+# The ETags of two DBs with the same versions are different
+def test_listing_etag_contains_db_identifier(app, client, authors):
+    etag = client.get('/posts').headers['ETag']
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    assert client.get('/posts').headers['ETag'] != etag
+
+
+# A new build (templates, static files) changes the validators of the listing
+def test_listing_validators_change_with_build(app, client, authors):
+    etag = client.get('/posts').headers['ETag']
+    assert app.config['BUILD_ID'] in etag
+    app.config['BUILD_ID'] = 'next-build'
+    response = client.get('/posts', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert 'next-build' in response.headers['ETag']
+
+    now = datetime.utcnow()
+    app.config['BUILD_TIME'] = now - timedelta(seconds=5)
+    with app.test_request_context('/posts'):
+        last_modified = validators_from_version(3, now - timedelta(minutes=5), 1)[1]
+        assert last_modified == (now - timedelta(seconds=5)).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+# Last-Modified is only sent once the second of the last change is over
+def test_listing_last_modified_precision(app):
+    now = datetime.utcnow()
+    with app.test_request_context('/posts'):
+        assert validators_from_version(3, now, 1)[1] is None
+        last_modified = validators_from_version(3, now - timedelta(seconds=2), 1)[1]
+        assert last_modified == (now - timedelta(seconds=2)).replace(microsecond=0, tzinfo=timezone.utc)
+
+
+# A DB created before the counters is upgraded when the app is created
+def test_upgrade_db_without_counters(app, authors, make_app):
+    with app.app_context():
+        db.session.execute(text('ALTER TABLE "user" DROP COLUMN post_count'))
+        db.session.execute(text('DROP TABLE counter'))
+        db.session.commit()
+    db.dispose_engines(app)
+
+    upgraded = make_app()
+    with upgraded.app_context():
+        assert db.session.get(Counter, 'posts').value == 3
+        assert db.session.get(User, authors[0]).post_count == 1
+    client = upgraded.test_client()
+    assert client.post('/login', data={'email': 'author0@example.com', 'password': 'password'}).status_code == 302
+    assert b'All posts by author0 (1)' in client.get(f'/posts?user={authors[0]}').data
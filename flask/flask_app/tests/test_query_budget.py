@@ -0,0 +1,52 @@
+import pytest
+
+from myblog.models import BlogPost
+from myblog.query_budget import QueryBudgetExceeded
+
+
+# The listings are checked against LISTING_QUERY_BUDGET (see conftest.py) : the authors of the posts must be
+# loaded with the posts, not with one query per post
+
+
+def test_posts_listing_within_budget(client, authors):
+    response = client.get('/posts')
+    assert response.status_code == 200
+    for i in range(3):
+        assert f'author{i}'.encode() in response.data
+
+
+def test_user_posts_listing_within_budget(client, authors):
+    response = client.get(f'/posts?user={authors[1]}')
+    assert response.status_code == 200
+    assert b'Post 1' in response.data
+    assert b'Post 0' not in response.data
+
+
+def test_posts_listing_logged_within_budget(client, authors, login):
+    login('author0@example.com')
+    for url in ('/posts', f'/posts?user={authors[0]}'):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert b'Edit' in response.data
+
+
+# Without the join on the authors, the listing runs one more query per author and goes over the budget
+def test_query_budget_detects_n_plus_1(client, authors, monkeypatch):
+    monkeypatch.setattr('myblog.posts.routes.posts_listing_query', lambda: BlogPost.query)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/posts')
+
+
+# The budget is also checked when the view fails after running the queries
+def test_query_budget_checked_on_error(client, authors, monkeypatch):
+    from myblog.posts import routes
+    render_template = routes.render_template
+
+    def render_and_fail(*args, **kwargs):
+        render_template(*args, **kwargs)
+        raise RuntimeError('failure after the queries')
+    monkeypatch.setattr(routes, 'posts_listing_query', lambda: BlogPost.query)
+    monkeypatch.setattr(routes, 'render_template', render_and_fail)
+    with pytest.raises(QueryBudgetExceeded) as excinfo:
+        client.get('/posts')
+    assert isinstance(excinfo.value.__context__, RuntimeError)
@@ -0,0 +1,40 @@
+from sqlalchemy import text
+
+from myblog import db
+from myblog.posts.search import search_statement
+
+
+def test_search(client, authors):
+    response = client.get('/posts/search?q=number+1')
+    assert response.status_code == 200
+    assert b'Post 1' in response.data
+    assert b'Post 0' not in response.data
+
+
+def test_search_without_terms(client, authors):
+    response = client.get('/posts/search?q=*')
+    assert response.status_code == 200
+    assert b'No post matches your search.' in response.data
+
+
+# An existing DB without the FTS5 table is searched with LIKE until the index is created
+def test_search_without_index(app, client, authors):
+    with app.app_context():
+        for trigger in ('insert', 'delete', 'update'):
+            db.session.execute(text(f'DROP TRIGGER blog_post_fts_{trigger}'))
+        db.session.execute(text('DROP TABLE blog_post_fts'))
+        db.session.commit()
+    response = client.get('/posts/search?q=NUMBER+2')
+    assert response.status_code == 200
+    assert b'Post 2' in response.data
+    assert b'Post 1' not in response.data
+
+
+# The DBs without full-text index (like MySQL) use LIKE, with the LIKE wildcards searched as plain characters
+def test_like_search_statement(app, authors):
+    with app.app_context():
+        ids = [row[0] for row in db.session.execute(*search_statement('mysql', 'content post', 1, 10))]
+        assert sorted(ids) == [1, 2, 3]
+        assert search_statement('mysql', '%', 1, 10) is None
+        ids = [row[0] for row in db.session.execute(*search_statement('mysql', 'number_0', 1, 10))]
+        assert ids == []
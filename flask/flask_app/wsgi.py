@@ -0,0 +1,7 @@
+from myblog import create_app
+
+# Entry point of the webapp for WSGI servers in production, used by gunicorn with its config file :
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# (run.py starts the development server of Flask, with the debugger and the reloader, only for local development)
+
+app = create_app()
@@ -0,0 +1,63 @@
+import argparse
+import timeit
+
+import numpy as np
+
+from calc import add, divide, add_array, divide_array
+
+# Benchmark of the vectorized functions (add_array, divide_array) against a loop calling add() and divide()
+#
+# For each size, the inputs are random floats, with some zero divisors (--zeros) for the divide policies that
+# handle them. The loops build a list, the vectorized functions write to a preallocated out array.
+
+
+def scalar_add(a, b):
+    return [add(x, y) for x, y in zip(a, b)]
+
+
+def scalar_divide(a, b):
+    return [divide(x, y) if y != 0 else float('nan') for x, y in zip(a, b)]
+
+
+def best(function, number, repeat):
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def run(args):
+    rng = np.random.default_rng(0)
+    print(f"{'size':>10} {'function':<20} {'loop':>12} {'vectorized':>12} {'speedup':>9}")
+    for size in args.sizes:
+        a = rng.random(size)
+        b = rng.random(size) + 0.5
+        b_zeros = b.copy()
+        b_zeros[rng.random(size) < args.zeros] = 0
+        a_list, b_list, b_zeros_list = a.tolist(), b.tolist(), b_zeros.tolist()
+        out = np.empty(size)
+        number = max(1, args.elements // size)
+
+        cases = [
+            ('add', lambda: scalar_add(a_list, b_list), lambda: add_array(a, b, out=out)),
+            ('divide', lambda: scalar_divide(a_list, b_list), lambda: divide_array(a, b, out=out)),
+            ('divide nan', lambda: scalar_divide(a_list, b_zeros_list),
+             lambda: divide_array(a, b_zeros, on_zero='nan', out=out)),
+            ('divide mask', lambda: scalar_divide(a_list, b_zeros_list),
+             lambda: divide_array(a, b_zeros, on_zero='mask', out=out)),
+        ]
+        for name, loop, vectorized in cases:
+            loop_time = best(loop, number, args.repeat)
+            vectorized_time = best(vectorized, number, args.repeat)
+            print(f'{size:>10} {name:<20} {loop_time * 1e6:>10.1f}us {vectorized_time * 1e6:>10.1f}us '
+                  f'{loop_time / vectorized_time:>8.1f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the vectorized calc functions to the scalar loop')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--zeros', type=float, default=0.01, help='fraction of zero divisors')
+    parser.add_argument('--elements', type=int, default=1000000, help='elements processed per measure')
+    parser.add_argument('--repeat', type=int, default=3, help='measures per case, the best one is used')
+    run(parser.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,9 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 
 
 # simple function to unit test
@@ -13,6 +18,59 @@ def divide(a, b):
     return a / b
 
 
+# exception raised by divide_array() for zero divisors, with the indices of the zeros
+# (flat indices for scalars and 1-d arrays, one row of coordinates per zero for the other shapes)
+class ZeroDivisorError(ValueError):
+    def __init__(self, indices):
+        self.indices = indices
+        super().__init__(f'Cannot divide by zero ({len(indices)} zero divisors).')
+
+
+# vectorized version of add() for NumPy arrays (or lists, buffers... anything np.asarray accepts)
+# out is an optional array receiving the result, to avoid allocating a new one
+# unlike add() on Python ints, the integer results wrap around on overflow (2**62 + 2**62 is negative in int64) :
+# pass a wider dtype, or dtype=object for exact Python ints (much slower)
+# NumPy is only needed by the array functions, so it is imported when they are called
+def add_array(a, b, out=None, dtype=None):
+    import numpy as np
+
+    return np.add(np.asarray(a), np.asarray(b), out=out, dtype=dtype)
+
+
+# vectorized version of divide(), the zero divisors are handled according to on_zero :
+#  - 'raise' : raise a ZeroDivisorError with the indices of all the zeros (nothing is written to out)
+#  - 'mask'  : return a masked array, with the results of the zero divisors masked
+#  - 'nan'   : the results of the zero divisors are NaN
+# the result is always a float array (like divide()), so out must have a float dtype
+def divide_array(a, b, on_zero='raise', out=None):
+    import numpy as np
+
+    if on_zero not in ('raise', 'mask', 'nan'):
+        raise ValueError(f'Unknown zero divisor policy : {on_zero}')
+    if out is not None and not np.issubdtype(out.dtype, np.inexact):
+        raise TypeError(f'out must have a float dtype, not {out.dtype}')
+    a = np.asarray(a)
+    b = np.asarray(b)
+    zeros = np.broadcast_to(b == 0, np.broadcast(a, b).shape)
+    if not zeros.any():
+        result = np.divide(a, b, out=out)
+        return np.ma.masked_array(result, mask=False) if on_zero == 'mask' else result
+
+    if on_zero == 'raise':
+        raise ZeroDivisorError(np.flatnonzero(zeros) if zeros.ndim <= 1 else np.argwhere(zeros))
+    if out is None:
+        # float dtype of the true division of the inputs (float64 for integers, float32 for float32...)
+        dtype = np.result_type(np.true_divide(np.ones(1, a.dtype), np.ones(1, b.dtype)).dtype, np.float16)
+        out = np.empty(zeros.shape, dtype=dtype)
+    # a single pass on the valid divisors only, then the results of the zeros are filled
+    np.divide(a, b, out=out, where=~zeros)
+    if on_zero == 'nan':
+        out[zeros] = np.nan
+        return out
+    out[zeros] = 0
+    return np.ma.masked_array(out, mask=zeros, copy=False)
+
+
 # class to unit test that calls an HTTP endpoint
 class Calculator:
     def __init__(self, a, b):
@@ -29,3 +87,80 @@ class Calculator:
             return response.text
         else:
             return None
+
+
+# client calling the same HTTP endpoint as Calculator.process() for many (a, b) pairs at once
+#  - the requests share a pool of keep-alive connections (one requests.Session) instead of a new connection each
+#  - up to max_workers requests run at the same time, each limited by a timeout
+#  - failed requests (connection errors, timeouts, 5xx and 429 responses) are retried with an exponential backoff
+#  - the results can be kept in a cache for cache_ttl seconds, keyed by (a, b)
+class BatchCalculator:
+    def __init__(self, base_url='http://calculator.com', max_workers=8, timeout=5.0, retries=2, backoff=0.1,
+                 cache_ttl=None):
+        self.url = f'{base_url.rstrip("/")}/process'
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_ttl = cache_ttl
+        self.cache = {}  # (a, b) -> (expiry time, result)
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    # results of the pairs in the same order, each is the text of the response or None if the call failed
+    def process_batch(self, pairs):
+        pairs = list(pairs)
+        unique_pairs = list(dict.fromkeys(pairs))  # each distinct pair is only sent once
+        if not unique_pairs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unique_pairs))) as executor:
+            results = dict(zip(unique_pairs, executor.map(lambda pair: self.process(*pair), unique_pairs)))
+        return [results[pair] for pair in pairs]
+
+    def process(self, a, b):
+        result = self._get_cached((a, b))
+        if result is not None:
+            return result
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                response = self.session.get(self.url, params={'a': a, 'b': b}, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                continue
+            if response.status_code >= 500 or response.status_code == 429:
+                continue
+            if not response.ok:
+                return None
+            self._set_cached((a, b), response.text)
+            return response.text
+        return None
+
+    def _get_cached(self, key):
+        if self.cache_ttl is None:
+            return None
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.cache[key]
+                return None
+            return entry[1]
+
+    def _set_cached(self, key, result):
+        if self.cache_ttl is not None:
+            with self.lock:
+                self.cache[key] = (time.monotonic() + self.cache_ttl, result)
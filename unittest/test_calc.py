@@ -1,7 +1,16 @@
+import threading
+import time
 import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
 
-from calc import add, divide, Calculator
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from calc import add, divide, add_array, divide_array, ZeroDivisorError, Calculator, BatchCalculator
 
 
 class TestCalc(unittest.TestCase):
@@ -57,5 +66,171 @@ class TestCalc(unittest.TestCase):
             mocked_get.assert_called_with('http://calculator.com/process?a=1&b=2')
 
 
+# Local HTTP server standing in for the calculator endpoint : it returns a + b
+# The tests can make it fail the next requests (503) or answer slowly.
+class CalculatorHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail = server.failures > 0
+            server.failures -= fail
+        time.sleep(server.delay)
+        params = parse_qs(urlparse(self.path).query)
+        if fail or urlparse(self.path).path != '/process':
+            self.send_response(503 if fail else 404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = str(int(params['a'][0]) + int(params['b'][0])).encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestBatchCalculator(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), CalculatorHandler)
+        cls.server.lock = threading.Lock()
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.requests = 0
+        self.server.failures = 0
+        self.server.delay = 0
+
+    def test_process_batch(self):
+        pairs = [(i, i * 10) for i in range(20)]
+        with BatchCalculator(self.base_url, max_workers=4) as calculator:
+            self.assertEqual(calculator.process_batch(pairs), [str(a + b) for a, b in pairs])
+            self.assertEqual(calculator.process_batch([]), [])
+        self.assertEqual(self.server.requests, 20)
+
+    def test_process_batch_duplicates(self):
+        # each distinct pair is only sent once
+        with BatchCalculator(self.base_url) as calculator:
+            self.assertEqual(calculator.process_batch([(1, 2), (3, 4), (1, 2)]), ['3', '7', '3'])
+        self.assertEqual(self.server.requests, 2)
+
+    def test_process_retries(self):
+        self.server.failures = 2
+        with BatchCalculator(self.base_url, retries=2, backoff=0.01) as calculator:
+            self.assertEqual(calculator.process(1, 2), '3')
+        self.assertEqual(self.server.requests, 3)
+
+        # more failures than retries
+        self.server.failures = 5
+        with BatchCalculator(self.base_url, retries=1, backoff=0.01) as calculator:
+            self.assertIsNone(calculator.process(1, 2))
+
+    def test_process_timeout(self):
+        self.server.delay = 0.5
+        with BatchCalculator(self.base_url, timeout=0.1, retries=0) as calculator:
+            start = time.perf_counter()
+            self.assertEqual(calculator.process_batch([(1, 2), (3, 4)]), [None, None])
+            self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_process_cache(self):
+        with BatchCalculator(self.base_url, cache_ttl=0.2) as calculator:
+            self.assertEqual(calculator.process_batch([(1, 2), (3, 4)]), ['3', '7'])
+            self.assertEqual(calculator.process_batch([(1, 2), (5, 6)]), ['3', '11'])
+            self.assertEqual(self.server.requests, 3)
+
+            # the cached results expire after the TTL
+            time.sleep(0.3)
+            self.assertEqual(calculator.process(1, 2), '3')
+            self.assertEqual(self.server.requests, 4)
+
+        # no cache by default
+        with BatchCalculator(self.base_url) as calculator:
+            calculator.process(1, 2)
+            calculator.process(1, 2)
+        self.assertEqual(self.server.requests, 6)
+
+
+@unittest.skipIf(np is None, 'NumPy is not installed')
+class TestArrayCalc(unittest.TestCase):
+
+    def test_add_array(self):
+        np.testing.assert_array_equal(add_array([1, 2, 3], [1, -2, 0.5]), [2, 0, 3.5])
+        np.testing.assert_array_equal(add_array(np.arange(3), 1), [1, 2, 3])
+
+    def test_add_array_out(self):
+        out = np.empty(3)
+        result = add_array(np.arange(3), np.arange(3), out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(out, [0, 2, 4])
+
+    def test_add_array_overflow(self):
+        a = np.array([2 ** 62], dtype=np.int64)
+        self.assertLess(add_array(a, a)[0], 0)
+        self.assertEqual(add_array(a, a, dtype=object)[0], add(2 ** 62, 2 ** 62))
+
+    def test_divide_array(self):
+        np.testing.assert_array_equal(divide_array([2, 5, -1], [1, 2, 4]), [2, 2.5, -0.25])
+        # true division, like divide()
+        self.assertEqual(divide_array(np.array([1]), np.array([2])).dtype, np.float64)
+
+    def test_divide_array_raise(self):
+        out = np.full(4, 7.0)
+        with self.assertRaises(ZeroDivisorError) as context:
+            divide_array([1, 2, 3, 4], [1, 0, 2, 0], out=out)
+        np.testing.assert_array_equal(context.exception.indices, [1, 3])
+        np.testing.assert_array_equal(out, 7.0)
+        with self.assertRaises(ValueError):
+            divide_array([1, 2], [0, 0])
+        # scalars and 2-d arrays
+        with self.assertRaises(ZeroDivisorError) as context:
+            divide_array(1, 0)
+        np.testing.assert_array_equal(context.exception.indices, [0])
+        with self.assertRaises(ZeroDivisorError) as context:
+            divide_array(np.ones((2, 2)), [[1, 0], [0, 1]])
+        np.testing.assert_array_equal(context.exception.indices, [[0, 1], [1, 0]])
+
+    def test_divide_array_mask(self):
+        result = divide_array([1, 2, 3], [1, 0, 2], on_zero='mask')
+        np.testing.assert_array_equal(result.mask, [False, True, False])
+        self.assertEqual(result.sum(), 2.5)
+        self.assertFalse(divide_array([1, 2], [1, 2], on_zero='mask').mask.any())
+
+    def test_divide_array_nan(self):
+        out = np.empty(3)
+        result = divide_array([1, 2, 3], [1, 0, 2], on_zero='nan', out=out)
+        self.assertIs(result, out)
+        np.testing.assert_array_equal(np.isnan(out), [False, True, False])
+        self.assertEqual(out[2], 1.5)
+        # a scalar divisor is broadcast
+        self.assertTrue(np.isnan(divide_array([1, 2], 0, on_zero='nan')).all())
+        self.assertTrue(np.isnan(divide_array(1, 0, on_zero='nan')))
+
+    def test_divide_array_integers(self):
+        a = np.array([1, 2, 3], dtype=np.int32)
+        b = np.array([2, 0, 2], dtype=np.int32)
+        result = divide_array(a, b, on_zero='nan')
+        self.assertTrue(np.issubdtype(result.dtype, np.floating))
+        np.testing.assert_array_equal(np.isnan(result), [False, True, False])
+        self.assertEqual(divide_array(a, b, on_zero='mask').sum(), 2.0)
+        with self.assertRaises(TypeError):
+            divide_array(a, b, on_zero='nan', out=np.empty(3, dtype=np.int64))
+
+    def test_divide_array_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            divide_array([1], [1], on_zero='ignore')
+
+
 if __name__ == '__main__':
     unittest.main()